@@ -0,0 +1,8 @@
+"""
+Performance benchmarks that run without a GPU or network access.
+
+    python -m benchmarks.load     # HTTP load against a server using a stub `sharp`
+    python -m benchmarks.micro    # hot functions on large inputs
+
+Run from the backend directory.
+"""
@@ -0,0 +1,93 @@
+"""
+Stand-in for the `sharp predict` CLI.
+
+Writes one synthetic PLY per input image, in the layout ml-sharp produces
+(including the `uint` image_size element the service sanitises), after
+sleeping to simulate inference:
+
+    FAKE_SHARP_GAUSSIANS   gaussians per PLY (default 1179648, a 1536px input)
+    FAKE_SHARP_DELAY       seconds per invocation (default 0.5)
+    FAKE_SHARP_IMAGE_DELAY extra seconds per image in the batch (default 0.2)
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+import numpy as np
+
+VERTEX_DTYPE = np.dtype([
+    (name, "<f4") for name in (
+        "x", "y", "z", "f_dc_0", "f_dc_1", "f_dc_2", "opacity",
+        "scale_0", "scale_1", "scale_2", "rot_0", "rot_1", "rot_2", "rot_3",
+    )
+])
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def write_synthetic_ply(path: Path, count: int, seed: int = 0, image_size=(1536, 1536)):
+    """Write a PLY of `count` random gaussians with ml-sharp's header layout."""
+    rng = np.random.default_rng(seed)
+    vertices = np.empty(count, dtype=VERTEX_DTYPE)
+    for axis in ("x", "y"):
+        vertices[axis] = rng.uniform(-1, 1, count)
+    vertices["z"] = rng.uniform(1, 4, count)
+    for channel in ("f_dc_0", "f_dc_1", "f_dc_2"):
+        vertices[channel] = rng.normal(0, 1, count)
+    vertices["opacity"] = rng.normal(0, 2, count)
+    for axis in ("scale_0", "scale_1", "scale_2"):
+        vertices[axis] = rng.uniform(-7, -3, count)
+    rotations = rng.normal(0, 1, (count, 4))
+    rotations /= np.linalg.norm(rotations, axis=1, keepdims=True)
+    for i in range(4):
+        vertices[f"rot_{i}"] = rotations[:, i]
+
+    header = (
+        "ply\nformat binary_little_endian 1.0\n"
+        f"element vertex {count}\n"
+        + "".join(f"property float {name}\n" for name in VERTEX_DTYPE.names)
+        + "element extrinsic 16\nproperty float extrinsic\n"
+        "element intrinsic 9\nproperty float intrinsic\n"
+        "element image_size 2\nproperty uint image_size\n"
+        "end_header\n"
+    )
+    width, height = image_size
+    focal = float(max(width, height))
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        f.write(vertices.tobytes())
+        f.write(np.eye(4, dtype="<f4").tobytes())
+        f.write(np.array([focal, 0, width / 2, 0, focal, height / 2, 0, 0, 1], dtype="<f4").tobytes())
+        f.write(np.array([width, height], dtype="<u4").tobytes())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="sharp")
+    commands = parser.add_subparsers(dest="command", required=True)
+    predict = commands.add_parser("predict")
+    predict.add_argument("-i", "--input-path", type=Path, required=True)
+    predict.add_argument("-o", "--output-path", type=Path, required=True)
+    predict.add_argument("-c", "--checkpoint-path", type=Path)
+    predict.add_argument("--device", default="cpu")
+    args = parser.parse_args(argv)
+
+    count = int(os.environ.get("FAKE_SHARP_GAUSSIANS", 1536 * 1536 // 2))
+    images = sorted(p for p in args.input_path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    time.sleep(
+        float(os.environ.get("FAKE_SHARP_DELAY", 0.5))
+        + float(os.environ.get("FAKE_SHARP_IMAGE_DELAY", 0.2)) * len(images)
+    )
+
+    args.output_path.mkdir(parents=True, exist_ok=True)
+    for image in images:
+        # Same input bytes -> same PLY, so runs are reproducible
+        seed = int.from_bytes(hashlib.sha256(image.read_bytes()).digest()[:8], "little")
+        write_synthetic_ply(args.output_path / f"{image.stem}.ply", count, seed)
+    print(f"Wrote {len(images)} synthetic PLY file(s) with {count} gaussians")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
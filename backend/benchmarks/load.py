@@ -0,0 +1,273 @@
+"""
+HTTP load generator for the cache-hit and cache-miss paths.
+
+Starts benchmarks.server in a fresh work directory (stub `sharp`, local
+OSS), then drives each scenario at a fixed concurrency and reports
+throughput and p50/p95/p99 latency:
+
+    upload_miss  POST /api/upload with new images, timed until the PLY is ready
+    upload_hit   the same images again (served from the cache)
+    oss_miss     POST /api/generate_from_oss_url with new objects, until ready
+    oss_hit      the same URLs again
+    ply          GET /api/ply/{filename} for the generated files
+
+    python -m benchmarks.load --requests 64 --concurrency 8 --gaussians 200000
+
+Miss latencies include queueing behind the other in-flight requests, so
+compare runs made with the same --requests/--concurrency/--delay.
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import requests
+from PIL import Image
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ("upload_miss", "upload_hit", "oss_miss", "oss_hit", "ply")
+OSS_IMAGE_PREFIX = "bench/images"
+
+
+def make_image(seed: int, size: int) -> bytes:
+    """A distinct, photo-like JPEG (smooth gradients plus noise)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    channels = [
+        np.sin(x * rng.uniform(2, 9) + y * rng.uniform(2, 9) + rng.uniform(0, 6)) for _ in range(3)
+    ]
+    pixels = (np.stack(channels, axis=-1) + 1) * 110 + rng.normal(0, 12, (size, size, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class Client:
+    """Thread-local HTTP sessions (connection reuse per load thread)."""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def post(self, path: str, **kwargs) -> dict:
+        response = self.session.post(self.base_url + path, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def wait_ready(self, result: dict) -> dict:
+        """Follow the task's event stream until it completes or fails."""
+        if result.get("status") in ("completed", "failed"):
+            return result
+        url = f"{self.base_url}/api/status/{result['task_id']}/events"
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if line and line.startswith("data:"):
+                    task = json.loads(line[5:])
+                    if task.get("status") in ("completed", "failed"):
+                        return task
+        raise RuntimeError(f"Event stream ended early for task {result['task_id']}")
+
+
+def run_scenario(work: List[Callable[[], None]], concurrency: int) -> dict:
+    """Run the calls at `concurrency` and summarise their latencies."""
+    latencies: List[float] = []
+    errors: List[str] = []
+    lock = threading.Lock()
+
+    def timed(call):
+        start = time.perf_counter()
+        try:
+            call()
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(timed, work))
+    wall = time.perf_counter() - started
+
+    summary = {"requests": len(work), "errors": len(errors), "seconds": wall,
+               "throughput": len(latencies) / wall if wall else 0.0}
+    if latencies:
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        summary.update(p50_ms=p50, p95_ms=p95, p99_ms=p99, max_ms=max(latencies) * 1000)
+    if errors:
+        summary["first_error"] = errors[0]
+    return summary
+
+
+def stage_breakdown(client: Client) -> Dict[str, Tuple[int, float]]:
+    """Per-stage (count, mean seconds) from the server's /metrics."""
+    text = client.session.get(client.base_url + "/metrics", timeout=client.timeout).text
+    sums: Dict[str, float] = {}
+    counts: Dict[str, int] = {}
+    for line in text.splitlines():
+        for suffix, target in (("_sum", sums), ("_count", counts)):
+            prefix = f"mlsharp_stage_duration_seconds{suffix}{{stage=\""
+            if line.startswith(prefix):
+                stage, _, value = line[len(prefix):].partition("\"} ")
+                target[stage] = float(value)
+    return {stage: (int(counts[stage]), sums[stage] / counts[stage]) for stage in counts if counts[stage]}
+
+
+def start_server(args, workdir: Path) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        FAKE_SHARP_GAUSSIANS=str(args.gaussians),
+        FAKE_SHARP_DELAY=str(args.delay),
+        FAKE_SHARP_IMAGE_DELAY=str(args.image_delay),
+    )
+    command = [
+        sys.executable, "-m", "benchmarks.server",
+        "--workdir", str(workdir), "--port", str(args.port), "--oss-latency", str(args.oss_latency),
+    ]
+    for item in args.set:
+        command += ["--set", item]
+    log = open(workdir / "server.log", "wb")
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Benchmark server exited; see {workdir / 'server.log'}")
+        try:
+            requests.get(f"http://127.0.0.1:{args.port}/", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Benchmark server did not start within 60s")
+
+
+def print_report(results: Dict[str, dict], stages: Dict[str, Tuple[int, float]]):
+    print(f"\n{'scenario':<12} {'reqs':>5} {'errs':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        if "p50_ms" in r:
+            print(f"{name:<12} {r['requests']:>5} {r['errors']:>5} {r['throughput']:>8.2f}"
+                  f" {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+        else:
+            print(f"{name:<12} {r['requests']:>5} {r['errors']:>5} {'-':>8}")
+        if r.get("first_error"):
+            print(f"  first error: {r['first_error']}")
+    if stages:
+        print(f"\n{'stage':<14} {'count':>6} {'mean ms':>9}")
+        for stage, (count, mean) in sorted(stages.items()):
+            print(f"{stage:<14} {count:>6} {mean * 1000:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=32, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--image-size", type=int, default=1024, help="side of the generated test images")
+    parser.add_argument("--gaussians", type=int, default=200_000, help="gaussians per stub PLY")
+    parser.add_argument("--delay", type=float, default=0.5, help="stub inference seconds per batch")
+    parser.add_argument("--image-delay", type=float, default=0.2, help="stub inference seconds per image")
+    parser.add_argument("--oss-latency", type=float, default=0.0)
+    parser.add_argument("--port", type=int, default=6108)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--workdir", type=Path, help="defaults to a new temporary directory")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                        help="config override passed to the server")
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+
+    workdir = (args.workdir or Path(tempfile.mkdtemp(prefix="mlsharp-bench-"))).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    print(f"Work directory: {workdir}")
+
+    # Distinct inputs for the upload and OSS scenarios, so OSS misses are real misses
+    print(f"Generating {2 * args.requests} test images ({args.image_size}px)...")
+    uploads = [make_image(seed, args.image_size) for seed in range(args.requests)]
+    oss_keys = []
+    for i in range(args.requests):
+        key = f"{OSS_IMAGE_PREFIX}/{i:05d}.jpg"
+        path = workdir / "oss" / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(make_image(100_000 + i, args.image_size))
+        oss_keys.append(key)
+
+    from benchmarks.local_oss import object_url
+    server = start_server(args, workdir)
+    client = Client(f"http://127.0.0.1:{args.port}", args.timeout)
+    ply_files: List[str] = []
+    files_lock = threading.Lock()
+
+    def record(task: dict):
+        if task.get("status") != "completed":
+            raise RuntimeError(task.get("error") or f"task ended as {task.get('status')}")
+        with files_lock:
+            ply_files.append(task["ply_filename"])
+
+    def upload(data: bytes, index: int):
+        def call():
+            files = {"file": (f"bench-{index}.jpg", data, "image/jpeg")}
+            record(client.wait_ready(client.post("/api/upload", files=files)))
+        return call
+
+    def from_oss(key: str):
+        def call():
+            record(client.wait_ready(client.post("/api/generate_from_oss_url", json={"url": object_url(key)})))
+        return call
+
+    def fetch(filename: str):
+        def call():
+            response = client.session.get(f"{client.base_url}/api/ply/{filename}", timeout=args.timeout)
+            response.raise_for_status()
+        return call
+
+    results: Dict[str, dict] = {}
+    try:
+        for name in scenarios:
+            if name in ("upload_miss", "upload_hit"):
+                work = [upload(data, i) for i, data in enumerate(uploads)]
+            elif name in ("oss_miss", "oss_hit"):
+                work = [from_oss(key) for key in oss_keys]
+            else:
+                names = sorted(set(ply_files))
+                if not names:
+                    print("Skipping ply: no generated files (run a miss scenario first)")
+                    continue
+                work = [fetch(names[i % len(names)]) for i in range(args.requests)]
+            print(f"Running {name} ({len(work)} requests, concurrency {args.concurrency})...")
+            results[name] = run_scenario(work, args.concurrency)
+        stages = stage_breakdown(client)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    print_report(results, stages)
+    if args.json:
+        args.json.write_text(json.dumps({"args": {k: str(v) for k, v in vars(args).items()},
+                                         "results": results,
+                                         "stages": stages}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
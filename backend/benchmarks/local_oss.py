@@ -0,0 +1,104 @@
+"""
+Directory-backed stand-in for the OSS bucket, so OSS download and the
+shared cache tier can be benchmarked without network access.
+
+`install(root)` points the process-wide OSSService at a `LocalBucket`;
+object keys map to files under `root`, and every request can be delayed
+by a fixed latency to approximate a real round trip.
+"""
+import hashlib
+import io
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+import oss2
+import oss_service
+
+# Placeholder credentials: the SDK objects are created but never contacted
+_CONFIG = {
+    "access_key_id": "benchmark",
+    "access_key_secret": "benchmark",
+    "endpoint": "oss.invalid",
+    "bucket_name": "benchmark",
+    "video_folder": "videos",
+    "image_folder": "images",
+}
+
+# Host used in the URLs passed to /api/generate_from_oss_url
+URL_PREFIX = "https://benchmark.oss.invalid/"
+
+
+@dataclass
+class _HeadResult:
+    etag: str
+    content_length: int
+
+
+class LocalBucket:
+    """The subset of `oss2.Bucket` that OSSService uses, backed by a directory."""
+
+    def __init__(self, root: Path, latency: float = 0.0):
+        self.root = Path(root)
+        self.latency = latency
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Object key outside bucket: {key}")
+        return path
+
+    def _existing(self, key: str) -> Path:
+        if self.latency:
+            time.sleep(self.latency)
+        path = self._path(key)
+        if not path.is_file():
+            raise oss2.exceptions.NoSuchKey(404, {}, b"", {})
+        return path
+
+    def head_object(self, key: str) -> _HeadResult:
+        path = self._existing(key)
+        stat = path.stat()
+        etag = hashlib.md5(f"{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest().upper()
+        return _HeadResult(etag, stat.st_size)
+
+    def get_object(self, key: str, byte_range: Optional[Tuple[int, int]] = None):
+        path = self._existing(key)
+        if byte_range is None:
+            return open(path, "rb")
+        start, end = byte_range
+        with open(path, "rb") as f:
+            f.seek(start)
+            return io.BytesIO(f.read(end - start + 1))
+
+    def get_object_to_file(self, key: str, filename: str, progress_callback=None):
+        shutil.copyfile(self._existing(key), filename)
+
+    def put_object_from_file(self, key: str, filename: str):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp = path.with_name(f"{path.name}.{os.getpid()}-{threading.get_ident()}.part")
+        shutil.copyfile(filename, temp)
+        os.replace(temp, path)
+
+    def sign_url(self, method: str, key: str, expires: int, **kwargs) -> str:
+        return f"{URL_PREFIX}{key}?Expires={int(time.time()) + expires}"
+
+
+def install(root: Path, latency: float = 0.0) -> LocalBucket:
+    """Make `get_oss_service()` return a service backed by a LocalBucket."""
+    bucket = LocalBucket(root, latency)
+    service = oss_service.OSSService(_CONFIG)
+    service.bucket = bucket
+    oss_service._oss_service = service
+    return bucket
+
+
+def object_url(key: str) -> str:
+    return URL_PREFIX + key
@@ -0,0 +1,150 @@
+"""
+Micro-benchmarks for the per-request hot paths, on large inputs:
+
+    ingest      stream an upload to disk while hashing it (upload_ingest)
+    normalize   decode, downscale and pixel-hash a camera-sized photo
+    sanitize    patch the `uint` PLY header in place (MLSharpService._sanitize_ply)
+    prepare     reorder a PLY by gaussian importance (prepare_ply)
+    csplat      encode the compact splat variant
+
+    python -m benchmarks.micro --repeat 5 --gaussians 1179648
+
+Each benchmark reports the best and median of --repeat runs; inputs are
+rebuilt outside the timed section.
+"""
+import argparse
+import asyncio
+import shutil
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+import numpy as np
+from PIL import Image
+from benchmarks.fake_sharp import write_synthetic_ply
+
+BENCHMARKS = ("ingest", "normalize", "sanitize", "prepare", "csplat")
+
+
+def measure(run: Callable[[], None], repeat: int, setup: Optional[Callable[[], None]] = None) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: List[float], size_bytes: int):
+    best, median = min(timings), statistics.median(timings)
+    throughput = size_bytes / best / 1024 ** 2 if best else 0.0
+    print(f"{name:<10} best {best * 1000:9.1f} ms   median {median * 1000:9.1f} ms"
+          f"   {throughput:8.1f} MB/s   ({size_bytes / 1024 ** 2:.1f} MB)")
+
+
+def bench_ingest(workdir: Path, args):
+    from fastapi import UploadFile
+    from upload_ingest import ingest_upload
+
+    source = workdir / "upload.bin"
+    with open(source, "wb") as f:
+        f.write(np.random.default_rng(0).bytes(args.upload_mb * 1024 ** 2))
+    dest = workdir / "ingested.bin"
+
+    def run():
+        with open(source, "rb") as f:
+            asyncio.run(ingest_upload(UploadFile(f, filename="upload.jpg"), dest))
+
+    report("ingest", measure(run, args.repeat), source.stat().st_size)
+
+
+def bench_normalize(workdir: Path, args):
+    from image_normalize import normalize_image
+
+    width, height = args.photo_size
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width] / max(width, height)
+    pixels = (np.stack([np.sin(x * 7 + c) + np.cos(y * 5 - c) for c in range(3)], axis=-1) + 2) * 60
+    pixels += rng.normal(0, 10, pixels.shape)
+    source = workdir / "photo.jpg"
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(source, quality=92)
+
+    def run():
+        normalize_image(source, workdir / "normalized.png", args.model_input_size)
+
+    report("normalize", measure(run, args.repeat), source.stat().st_size)
+
+
+def bench_sanitize(workdir: Path, ply: Path, args):
+    from ml_sharp_service import MLSharpService
+
+    # _sanitize_ply does not touch instance state, so skip model setup
+    service = MLSharpService.__new__(MLSharpService)
+    target = workdir / "sanitize.ply"
+
+    timings = measure(
+        lambda: service._sanitize_ply(target),
+        args.repeat,
+        setup=lambda: shutil.copyfile(ply, target),
+    )
+    report("sanitize", timings, ply.stat().st_size)
+
+
+def bench_prepare(workdir: Path, ply: Path, args):
+    from ply_artifacts import prepare_ply
+
+    target = workdir / "prepare.ply"
+    timings = measure(
+        lambda: prepare_ply(target),
+        args.repeat,
+        setup=lambda: shutil.copyfile(ply, target),
+    )
+    report("prepare", timings, ply.stat().st_size)
+
+
+def bench_csplat(workdir: Path, ply: Path, args):
+    from splat_codec import encode_csplat
+
+    timings = measure(lambda: encode_csplat(ply, workdir / "out.csplat"), args.repeat)
+    report("csplat", timings, ply.stat().st_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", default=",".join(BENCHMARKS))
+    parser.add_argument("--gaussians", type=int, default=1536 * 1536 // 2)
+    parser.add_argument("--upload-mb", type=int, default=50)
+    parser.add_argument("--photo-size", type=lambda s: tuple(int(v) for v in s.split("x")),
+                        default=(4032, 3024), help="WIDTHxHEIGHT of the normalize input")
+    parser.add_argument("--model-input-size", type=int, default=1536)
+    args = parser.parse_args(argv)
+
+    selected = [name for name in args.only.split(",") if name]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory(prefix="mlsharp-micro-") as temp:
+        workdir = Path(temp)
+        ply = workdir / "source.ply"
+        if {"sanitize", "prepare", "csplat"} & set(selected):
+            write_synthetic_ply(ply, args.gaussians)
+        for name in selected:
+            if name == "ingest":
+                bench_ingest(workdir, args)
+            elif name == "normalize":
+                bench_normalize(workdir, args)
+            elif name == "sanitize":
+                bench_sanitize(workdir, ply, args)
+            elif name == "prepare":
+                bench_prepare(workdir, ply, args)
+            else:
+                bench_csplat(workdir, ply, args)
+
+
+if __name__ == "__main__":
+    main()
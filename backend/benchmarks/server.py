@@ -0,0 +1,81 @@
+"""
+Run the API for benchmarking: all data under one work directory, the stub
+`sharp` CLI first on PATH and OSS served by a LocalBucket.
+
+    python -m benchmarks.server --workdir /tmp/bench --port 6108 \
+        --set GENERATION_MAX_BATCH_SIZE=4 --set OSS_CACHE_ENABLED=true
+
+`--set` overrides any config attribute (values are parsed as JSON when
+possible). Usually started by benchmarks.load rather than by hand.
+"""
+import argparse
+import json
+import os
+import stat
+import sys
+from pathlib import Path
+
+FAKE_SHARP = Path(__file__).with_name("fake_sharp.py")
+
+
+def install_fake_sharp(bin_dir: Path):
+    """Put a `sharp` executable running fake_sharp.py first on PATH."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    script = bin_dir / "sharp"
+    script.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_SHARP}" "$@"\n')
+    script.chmod(script.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+
+
+def configure(workdir: Path, overrides: dict):
+    """Point config at the work directory before the app modules are imported."""
+    import config
+    for name in ("uploads", "cache", "oss_tmp", "models"):
+        (workdir / name).mkdir(parents=True, exist_ok=True)
+    checkpoint = workdir / "models" / "sharp.pt"
+    checkpoint.touch()
+    config.UPLOAD_DIR = workdir / "uploads"
+    config.CACHE_DIR = workdir / "cache"
+    config.OSS_TEMP_DIR = workdir / "oss_tmp"
+    config.MODEL_CHECKPOINT_PATH = checkpoint
+    config.SHARP_ENGINE_MODE = "cli"
+    # All load comes from one address; the queue depth limit still applies
+    config.GENERATION_MAX_PER_CLIENT = 0
+    for name, value in overrides.items():
+        setattr(config, name, value)
+
+
+def parse_overrides(items) -> dict:
+    overrides = {}
+    for item in items:
+        name, _, raw = item.partition("=")
+        try:
+            overrides[name] = json.loads(raw)
+        except ValueError:
+            overrides[name] = raw
+    return overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workdir", type=Path, required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6108)
+    parser.add_argument("--oss-latency", type=float, default=0.0, help="seconds added to each OSS request")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir.resolve()
+    install_fake_sharp(workdir / "bin")
+    configure(workdir, parse_overrides(args.set))
+
+    from benchmarks import local_oss
+    local_oss.install(workdir / "oss", args.oss_latency)
+
+    import uvicorn
+    from main import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
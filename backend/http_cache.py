@@ -0,0 +1,178 @@
+import gzip
+import os
+import re
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+try:
+    import zstandard
+except ImportError:  # zstd variants are optional
+    zstandard = None
+
+# Content-addressed files never change, so clients and CDNs may keep them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Content-Encoding -> precompressed file suffix, in server preference order
+ENCODINGS = {"zstd": ".zst", "gzip": ".gz"}
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK_SIZE = 256 * 1024
+
+
+def precompress(path: Path) -> List[Path]:
+    """
+    Write gzip (and, if `zstandard` is installed, zstd) variants next to a file.
+    Each variant is written atomically and only kept when it is smaller.
+    """
+    written = []
+    for encoding, suffix in ENCODINGS.items():
+        if encoding == "zstd" and zstandard is None:
+            continue
+        target = path.with_name(path.name + suffix)
+        # Per-writer name, so concurrent builds of one file never share a temp file
+        temp = target.with_name(f"{target.name}.{os.getpid()}-{threading.get_ident()}.part")
+        with open(path, "rb") as src, open(temp, "wb") as dst:
+            if encoding == "zstd":
+                zstandard.ZstdCompressor(level=9).copy_stream(src, dst)
+            else:
+                with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=6, mtime=0) as gz:
+                    shutil.copyfileobj(src, gz, _CHUNK_SIZE)
+        if temp.stat().st_size < path.stat().st_size:
+            os.replace(temp, target)
+            written.append(target)
+        else:
+            temp.unlink()
+    return written
+
+
+def _accepted_encodings(request: Request) -> Dict[str, float]:
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        parts = item.strip().split(";")
+        if not parts[0]:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[parts[0].lower()] = q
+    return accepted
+
+
+def _select_variant(request: Request, path: Path) -> Tuple[Path, Optional[str]]:
+    """Pick the best precompressed variant the client accepts, else the file itself."""
+    accepted = _accepted_encodings(request)
+    for encoding, suffix in ENCODINGS.items():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            variant = path.with_name(path.name + suffix)
+            if variant.exists():
+                return variant, encoding
+    return path, None
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    return etag in [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range into inclusive (start, end).
+    Returns None for ranges we do not serve partially (e.g. multiple ranges),
+    and raises ValueError for unsatisfiable ones.
+    """
+    match = _RANGE_RE.match(header.replace(" ", ""))
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+
+def _iter_file(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def cached_file_response(
+    request: Request,
+    path: Path,
+    etag: str,
+    media_type: str,
+    filename: Optional[str] = None,
+) -> Response:
+    """
+    Serve an immutable, content-addressed file.
+
+    Adds a strong ETag and long-lived immutable Cache-Control, answers
+    If-None-Match with 304, serves gzip/zstd variants precomputed by
+    `precompress` according to Accept-Encoding, and honours single byte
+    Range requests (with If-Range) on the selected representation.
+    With `filename`, the file is sent as a download (Content-Disposition:
+    attachment); without it, it is served inline.
+    """
+    file_path, encoding = _select_variant(request, path)
+    if encoding:
+        etag = f"{etag[:-1]}-{encoding}\""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+        "Accept-Ranges": "bytes",
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        size = file_path.stat().st_size
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(length)
+            return StreamingResponse(
+                _iter_file(file_path, start, length),
+                status_code=206,
+                media_type=media_type,
+                headers=headers,
+            )
+
+    return FileResponse(file_path, media_type=media_type, headers=headers)
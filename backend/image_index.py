@@ -0,0 +1,161 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional
+import numpy as np
+from image_normalize import NormalizedImage
+
+# Set bits per byte value, for vectorised Hamming distances
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# Keys seen this recently are kept even when not cached (their generation may be in flight)
+PRUNE_MIN_AGE = 3600
+
+
+class ImageKeyIndex:
+    """
+    Persistent index of normalised image keys.
+
+    Maps the SHA-256 of uploaded file bytes to the normalised pixel key
+    (see image_normalize.py), so exact repeat uploads skip decoding, and
+    keeps each key's perceptual hash for near-duplicate lookups. The
+    perceptual hashes are mirrored in memory as a NumPy array and compared
+    in one vectorised pass; rows added by other processes are picked up
+    incrementally. Keys whose PLY has left the cache are pruned
+    periodically, which makes every process rebuild its array.
+    """
+
+    def __init__(self, db_path: Path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " file_hash TEXT PRIMARY KEY,"
+            " key TEXT NOT NULL,"
+            " width INTEGER NOT NULL,"
+            " height INTEGER NOT NULL,"
+            " updated REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS phashes ("
+            " id INTEGER PRIMARY KEY,"
+            " key TEXT NOT NULL UNIQUE,"
+            " phash INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_key ON files(key)")
+        # Bumped by every prune, so other processes know to rebuild their arrays
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS generation ("
+            " id INTEGER PRIMARY KEY CHECK (id = 0),"
+            " value INTEGER NOT NULL)"
+        )
+        self._db.execute("INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0)")
+        self._keys: List[str] = []
+        self._phashes = np.empty(0, dtype=np.int64)
+        self._last_id = 0
+        self._generation = 0
+
+    def get(self, file_hash: str) -> Optional[NormalizedImage]:
+        """Normalised identity of a previously seen file, by its byte hash."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT f.key, p.phash, f.width, f.height FROM files f"
+                " JOIN phashes p ON p.key = f.key WHERE f.file_hash = ?",
+                (file_hash,),
+            ).fetchone()
+        return NormalizedImage(*row) if row else None
+
+    def put(self, file_hash: str, image: NormalizedImage):
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (file_hash, key, width, height, updated)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (file_hash, image.key, image.width, image.height, time.time()),
+            )
+            self._db.execute(
+                "INSERT OR IGNORE INTO phashes (key, phash) VALUES (?, ?)", (image.key, image.phash)
+            )
+            self._db.execute("COMMIT")
+
+    def nearest(self, phash: int, max_distance: int, limit: int = 5) -> List[str]:
+        """
+        Keys whose perceptual hash is within `max_distance` bits of `phash`,
+        closest first.
+        """
+        with self._lock:
+            self._refresh_locked()
+            if not self._keys:
+                return []
+            diff = (self._phashes ^ np.int64(phash)).view(np.uint8).reshape(-1, 8)
+            distances = _POPCOUNT[diff].sum(axis=1, dtype=np.int32)
+            candidates = np.flatnonzero(distances <= max_distance)
+            order = candidates[np.argsort(distances[candidates], kind="stable")][:limit]
+            return [self._keys[i] for i in order]
+
+    def prune(self, is_cached: Callable[[str], bool], min_age: float = PRUNE_MIN_AGE) -> int:
+        """
+        Forget keys that are no longer cached and were last uploaded more than
+        `min_age` seconds ago, with their file mappings and perceptual hashes.
+
+        Returns:
+            Number of keys removed
+        """
+        cutoff = time.time() - min_age
+        with self._lock:
+            keys = [key for (key,) in self._db.execute(
+                "SELECT key FROM files GROUP BY key HAVING MAX(updated) < ?", (cutoff,)
+            ).fetchall()]
+        # Checked without the lock: `is_cached` takes the cache's own lock
+        stale = [(key,) for key in keys if not is_cached(key)]
+        if not stale:
+            return 0
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "DELETE FROM files WHERE key = ? AND updated < ?", [(key, cutoff) for (key,) in stale]
+                )
+                self._db.executemany(
+                    "DELETE FROM phashes WHERE key = ?"
+                    " AND NOT EXISTS (SELECT 1 FROM files WHERE files.key = phashes.key)",
+                    stale,
+                )
+                self._db.execute("UPDATE generation SET value = value + 1")
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(stale)
+
+    async def run_pruner(self, interval: float, is_cached: Callable[[str], bool]):
+        """Prune periodically in a worker thread until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await loop.run_in_executor(None, self.prune, is_cached)
+                if removed:
+                    print(f"Image index prune: {removed} uncached key(s) removed")
+            except Exception as e:
+                print(f"Image index prune failed: {e}")
+
+    def _refresh_locked(self):
+        (generation,) = self._db.execute("SELECT value FROM generation").fetchone()
+        if generation != self._generation:
+            # Rows were pruned: rebuild from scratch
+            self._keys = []
+            self._phashes = np.empty(0, dtype=np.int64)
+            self._last_id = 0
+            self._generation = generation
+        rows = self._db.execute(
+            "SELECT id, key, phash FROM phashes WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        if not rows:
+            return
+        self._keys.extend(key for _, key, _ in rows)
+        self._phashes = np.concatenate([self._phashes, np.array([p for _, _, p in rows], dtype=np.int64)])
+        self._last_id = rows[-1][0]
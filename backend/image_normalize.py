@@ -0,0 +1,101 @@
+import hashlib
+import math
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageOps
+
+# EXIF tags that ml-sharp reads to derive the focal length in pixels; they
+# are carried over to the normalised image and are part of the cache key
+_EXIF_IFD = 0x8769
+_FOCAL_TAGS = (0x920A, 0xA405)  # FocalLength, FocalLengthIn35mmFilm
+
+# Bump when the normalisation changes, so old keys stop matching
+_KEY_VERSION = b"ml-sharp-pixels-v1"
+
+# DCT-II basis for the 32x32 perceptual hash
+_PHASH_SIZE = 32
+_DCT = np.sqrt(2.0 / _PHASH_SIZE) * np.cos(
+    np.pi * np.outer(np.arange(_PHASH_SIZE), 2 * np.arange(_PHASH_SIZE) + 1) / (2 * _PHASH_SIZE)
+)
+_DCT[0] /= np.sqrt(2.0)
+
+
+@dataclass
+class NormalizedImage:
+    """Cache identity of an input image and the size the model sees."""
+    key: str
+    phash: int
+    width: int
+    height: int
+
+
+def model_input_size(width: int, height: int, resolution: int):
+    """
+    Smallest size (same aspect ratio) that still gives the model its full
+    `resolution` on both axes. ml-sharp resamples every input to a square
+    working resolution, so any pixels beyond this are discarded anyway.
+    """
+    scale = min(1.0, max(resolution / width, resolution / height))
+    return max(1, math.ceil(width * scale - 1e-6)), max(1, math.ceil(height * scale - 1e-6))
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit DCT perceptual hash, as a signed integer (fits SQLite INTEGER)."""
+    small = image.convert("L").resize((_PHASH_SIZE, _PHASH_SIZE), Image.BILINEAR)
+    dct = _DCT @ np.asarray(small, dtype=np.float64) @ _DCT.T
+    block = dct[:8, :8].ravel()
+    bits = block > np.median(block[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big", signed=True)
+
+
+def _focal_exif(exif: Image.Exif) -> Image.Exif:
+    """A fresh EXIF block holding only the focal length tags, where the source had them."""
+    out = Image.Exif()
+    for tag in _FOCAL_TAGS:
+        if tag in exif:
+            out[tag] = exif[tag]
+    source_ifd = exif.get_ifd(_EXIF_IFD)
+    focal = {tag: source_ifd[tag] for tag in _FOCAL_TAGS if tag in source_ifd}
+    if focal:
+        out.get_ifd(_EXIF_IFD).update(focal)
+    return out
+
+
+def _focal_key(exif: Image.Exif) -> bytes:
+    ifd = exif.get_ifd(_EXIF_IFD)
+    values = [(tag, exif.get(tag), ifd.get(tag)) for tag in _FOCAL_TAGS]
+    return repr(values).encode("ascii", errors="replace")
+
+
+def normalize_image(source_path: Path, output_path: Path, resolution: int) -> NormalizedImage:
+    """
+    Decode an input image once and write what the model actually consumes:
+    orientation applied, RGB, downscaled to `model_input_size`, stored as
+    a fast lossless PNG with only the focal length EXIF kept.
+
+    The cache key is the SHA-256 of those pixels plus size and focal
+    length, so re-saved or format-converted copies of the same picture
+    share a key. Focal length sets the intrinsics ml-sharp reconstructs
+    with, so a copy stripped of (or carrying different) focal EXIF gets its
+    own key: the scene generated from it really is different. The
+    perceptual hash additionally allows near-duplicate matching (e.g.
+    re-compressed JPEGs).
+    """
+    with Image.open(source_path) as img:
+        exif = img.getexif()
+        image = ImageOps.exif_transpose(img).convert("RGB")
+
+    size = model_input_size(image.width, image.height, resolution)
+    if size != image.size:
+        image = image.resize(size, Image.LANCZOS)
+
+    pixels = np.ascontiguousarray(np.asarray(image, dtype=np.uint8))
+    sha = hashlib.sha256(_KEY_VERSION)
+    sha.update(struct.pack("<II", image.width, image.height))
+    sha.update(_focal_key(exif))
+    sha.update(memoryview(pixels).cast("B"))
+
+    image.save(output_path, format="PNG", compress_level=1, exif=_focal_exif(exif).tobytes())
+    return NormalizedImage(sha.hexdigest(), perceptual_hash(image), image.width, image.height)
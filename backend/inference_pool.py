@@ -0,0 +1,330 @@
+import multiprocessing
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+import config
+
+# A worker that exits this many times in a row before its model is loaded
+# is disabled instead of being restarted again (e.g. a missing device)
+MAX_START_FAILURES = 3
+# Extra seconds a batch is given over its timeout, so a `sharp predict` run
+# timing out inside the worker is reported before the worker is killed
+TIMEOUT_GRACE = 30
+# Seconds between the monitor's checks of idle workers (model loaded, process died)
+MONITOR_INTERVAL = 1.0
+
+
+def _pin_slot(slot: str, cpu_threads: int):
+    """Restrict this process (and any `sharp` CLI it spawns) to one device slot."""
+    if slot == "cpu":
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    else:
+        os.environ["CUDA_VISIBLE_DEVICES"] = slot.split(":", 1)[1]
+    if cpu_threads:
+        for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+            os.environ[name] = str(cpu_threads)
+
+
+def _worker_main(slot: str, cpu_threads: int, warm_up: bool, conn):
+    """
+    Inference worker process: load (and optionally warm up) the service
+    once, announce readiness, then run batches received on `conn` until
+    the parent closes it. Each reply is a list of per-job error messages
+    (None where the PLY was generated).
+    """
+    _pin_slot(slot, cpu_threads)
+    from ml_sharp_service import initialise_service
+
+    service = initialise_service(warm_up)
+    conn.send(("ready", service.device))
+    while True:
+        try:
+            jobs = conn.recv()
+        except EOFError:
+            break
+        if jobs is None:
+            break
+        errors = service.generate_ply_batch(jobs)
+        conn.send([None if e is None else f"{type(e).__name__}: {e}" for e in errors])
+
+
+class _Worker:
+    """One pinned worker process; used by a single batch at a time."""
+
+    def __init__(self, index: int, slot: str, cpu_threads: int, warm_up: bool, timeout: float, context):
+        self.index = index
+        self.slot = slot
+        self.cpu_threads = cpu_threads
+        self.warm_up = warm_up
+        self.timeout = timeout
+        self._context = context
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.busy = False
+        self.disabled = False
+        self.busy_seconds = 0.0
+        self.batches = 0
+        self.images = 0
+        self.restarts = 0
+        self.start_failures = 0
+
+    def start(self):
+        parent_conn, child_conn = self._context.Pipe()
+        self.process = self._context.Process(
+            target=_worker_main,
+            args=(self.slot, self.cpu_threads, self.warm_up, child_conn),
+            name=f"inference-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.ready = False
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def run(self, jobs: List[Tuple[Path, Path]]) -> List[Optional[Exception]]:
+        if not self.alive():
+            if self.process is not None:
+                self._restart("found dead")
+            else:
+                self.start()
+        if self.disabled:
+            return [RuntimeError(f"Inference worker {self.index} ({self.slot}) is disabled") for _ in jobs]
+        started = time.monotonic()
+        try:
+            if not self.ready:
+                self._receive_ready()
+            self.conn.send(jobs)
+            budget = self.timeout * len(jobs) + TIMEOUT_GRACE
+            if self.timeout and not self.conn.poll(budget):
+                # Hung (or far too slow): kill it rather than hold the slot forever
+                self.process.kill()
+                self._restart("timed out")
+                return [TimeoutError(
+                    f"Inference worker {self.index} ({self.slot}) timed out after {budget:.0f}s"
+                ) for _ in jobs]
+            messages = self.conn.recv()
+        except (EOFError, OSError):
+            self._restart("exited unexpectedly")
+            return [RuntimeError(f"Inference worker {self.index} ({self.slot}) crashed") for _ in jobs]
+        finally:
+            self.busy_seconds += time.monotonic() - started
+            self.batches += 1
+            self.images += len(jobs)
+        return [None if m is None else RuntimeError(m) for m in messages]
+
+    def poll_ready(self) -> bool:
+        """
+        Pick up the ready message without blocking, restarting the process
+        if it has died (only while the worker is idle).
+        """
+        if self.process is not None and not self.alive():
+            self._restart("found dead")
+        if not self.ready and self.conn is not None:
+            try:
+                if self.conn.poll():
+                    self._receive_ready()
+            except (EOFError, OSError):
+                pass  # found dead on the next poll
+        return self.ready
+
+    def _receive_ready(self):
+        _, device = self.conn.recv()
+        self.ready = True
+        self.start_failures = 0
+        print(f"Inference worker {self.index} ready on {self.slot} ({device})")
+
+    def _restart(self, reason: str):
+        if not self.ready:
+            self.start_failures += 1
+        self.ready = False
+        exitcode = None
+        if self.process is not None:
+            self.process.join(timeout=5)
+            exitcode = self.process.exitcode
+        if self.conn is not None:
+            self.conn.close()
+        self.process = None
+        self.conn = None
+        if self.start_failures >= MAX_START_FAILURES:
+            self.disabled = True
+            print(f"Inference worker {self.index} ({self.slot}) failed to start "
+                  f"{self.start_failures} times, disabling it")
+            return
+        self.restarts += 1
+        print(f"Inference worker {self.index} ({self.slot}) {reason} (exit code {exitcode}), restarting")
+        self.start()
+
+    def stop(self):
+        if self.conn is not None:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.conn.close()
+        if self.process is not None:
+            self.process.join(timeout=10)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.process = None
+        self.conn = None
+
+
+class InferencePool:
+    """
+    Pool of inference worker processes, each pinned to a device slot.
+
+    Slots are "cuda:N" (the process only sees GPU N) or "cpu"; a slot may
+    be listed several times to run more than one worker on a device.
+    Each worker loads the model once and runs one batch at a time. Batches
+    go to an idle worker, preferring the one with the least accumulated
+    busy time, and wait when every worker is busy, so whichever worker
+    frees up first takes the next batch. Crashed workers are restarted;
+    the batch they were running fails. A batch that gets no reply within
+    `timeout` seconds per image (0 disables) kills and restarts its worker.
+    A monitor thread picks up loaded models and restarts workers that die
+    while idle, so `readiness` and `stats` only read state.
+
+    Exposes the same `generate_ply_batch` as MLSharpService, and is
+    called from executor threads.
+    """
+
+    def __init__(self, slots: Sequence[str], cpu_threads: int = 0, warm_up: bool = True, timeout: float = 0):
+        for slot in slots:
+            if slot != "cpu" and not (slot.startswith("cuda:") and slot[5:].isdigit()):
+                raise ValueError(f"Invalid inference device slot {slot!r} (expected 'cuda:N' or 'cpu')")
+        if not cpu_threads and "cpu" in slots:
+            # Share the cores between the CPU slots
+            cpu_threads = max(1, (os.cpu_count() or 1) // list(slots).count("cpu"))
+        # spawn: children must not inherit the event loop, threads or CUDA state
+        context = multiprocessing.get_context("spawn")
+        self.workers = [
+            _Worker(i, slot, cpu_threads if slot == "cpu" else 0, warm_up, timeout, context)
+            for i, slot in enumerate(slots)
+        ]
+        self._condition = threading.Condition()
+        self._started_at = time.monotonic()
+        self._monitor: Optional[threading.Thread] = None
+        self._closing = threading.Event()
+
+    @property
+    def size(self) -> int:
+        return len(self.workers)
+
+    def start(self):
+        """Spawn every worker; models load in the background."""
+        self._started_at = time.monotonic()
+        for worker in self.workers:
+            if worker.process is None and not worker.disabled:
+                worker.start()
+        if self._monitor is None:
+            self._closing.clear()
+            self._monitor = threading.Thread(target=self._watch, name="inference-monitor", daemon=True)
+            self._monitor.start()
+
+    def _watch(self):
+        while not self._closing.wait(MONITOR_INTERVAL):
+            with self._condition:
+                if self._poll_idle():
+                    self._condition.notify_all()
+
+    def _poll_idle(self) -> bool:
+        """Poll every idle worker (restarting dead ones); True if any became ready."""
+        became_ready = False
+        for worker in self.workers:
+            if not worker.busy and not worker.disabled:
+                was_ready = worker.ready
+                if worker.poll_ready() and not was_ready:
+                    became_ready = True
+        return became_ready
+
+    def generate_ply_batch(self, jobs: List[Tuple[Path, Path]]) -> List[Optional[Exception]]:
+        worker = self._acquire()
+        if worker is None:
+            return [RuntimeError("No inference workers available") for _ in jobs]
+        try:
+            return worker.run(jobs)
+        finally:
+            with self._condition:
+                worker.busy = False
+                self._condition.notify_all()
+
+    def _acquire(self) -> Optional[_Worker]:
+        with self._condition:
+            while True:
+                self._poll_idle()
+                # Checked after polling, which may have disabled a worker
+                usable = [w for w in self.workers if not w.disabled]
+                if not usable:
+                    return None
+                idle = [w for w in usable if not w.busy]
+                if any(w.ready for w in usable):
+                    # Never queue behind a loading model while a loaded one exists
+                    idle = [w for w in idle if w.ready]
+                if idle:
+                    worker = min(idle, key=lambda w: w.busy_seconds)
+                    worker.busy = True
+                    return worker
+                # Woken by a finished batch or by the monitor once a model loads
+                self._condition.wait(timeout=MONITOR_INTERVAL)
+
+    def readiness(self) -> dict:
+        """Ready once any worker has loaded (and warmed up) its model."""
+        # A plain read: the monitor thread keeps `ready` current (it is called from the event loop)
+        ready = sum(w.ready for w in self.workers)
+        disabled = sum(w.disabled for w in self.workers)
+        if ready:
+            status = "ready"
+        elif disabled == len(self.workers):
+            status = "failed"
+        else:
+            status = "loading"
+        return {"status": status, "workers_ready": ready, "workers": len(self.workers)}
+
+    def stats(self) -> List[Dict]:
+        """Per-worker state and utilisation (busy fraction since the pool started)."""
+        elapsed = max(time.monotonic() - self._started_at, 1e-9)
+        return [
+            {
+                "worker": w.index,
+                "slot": w.slot,
+                "alive": w.alive(),
+                "ready": w.ready,
+                "busy": w.busy,
+                "disabled": w.disabled,
+                "batches": w.batches,
+                "images": w.images,
+                "restarts": w.restarts,
+                "utilisation": min(1.0, w.busy_seconds / elapsed),
+            }
+            for w in self.workers
+        ]
+
+    def close(self):
+        self._closing.set()
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+        for worker in self.workers:
+            worker.stop()
+
+
+def create_inference_pool() -> Optional[InferencePool]:
+    """
+    Build the pool from `config.INFERENCE_DEVICES` (e.g. ["cuda:0", "cuda:1"]).
+    None (the default) keeps inference in the API process.
+    """
+    slots = getattr(config, "INFERENCE_DEVICES", None)
+    if not slots:
+        return None
+    return InferencePool(
+        list(slots),
+        cpu_threads=getattr(config, "INFERENCE_CPU_THREADS", 0),
+        warm_up=getattr(config, "WARMUP_INFERENCE", True),
+        timeout=getattr(config, "INFERENCE_TIMEOUT", 300),
+    )
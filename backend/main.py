@@ -1,17 +1,33 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import asyncio
+import ipaddress
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
 from pathlib import Path
+from urllib.parse import urlparse
+import json
 import uuid
-import hashlib
-import time
-import shutil
-from typing import Dict
+from typing import List, Optional
 from pydantic import BaseModel
-from PIL import Image
 import config
-from ml_sharp_service import get_service
-from oss_service import OSSService
+from http_cache import cached_file_response
+from image_index import ImageKeyIndex
+from image_normalize import NormalizedImage, normalize_image
+from inference_pool import create_inference_pool
+from metrics import CACHE_REQUESTS, CONTENT_TYPE, STAGE_SECONDS, Gauge, MetricsMiddleware, render
+from ml_sharp_service import initialise_service, readiness
+from oss_index import OssHashIndex, OssImageRecord
+from oss_service import get_oss_service
+from ply_artifacts import (
+    FORMATS, THUMBNAIL_MEDIA_TYPE, ArtifactBuilder, PreviewRenderer, ensure_decimated, ensure_format, ensure_meta,
+)
+from ply_cache import PlyCache, is_cache_key
+from remote_cache import RemotePlyCache
+from splat_decimate import resolve_level
+from task_queue import GenerationJob, GenerationQueue, GenerationRejected
+from task_events import TaskEvents
+from task_store import create_task_store
+from upload_ingest import UploadTooLarge, ingest_upload
 
 app = FastAPI(title="ML-Sharp API", version="1.0.0")
 
@@ -23,38 +39,355 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request counts and latency per route, exposed at /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Reject uploads larger than this (bytes, 0 disables the limit)
+MAX_UPLOAD_BYTES = getattr(config, "MAX_UPLOAD_BYTES", 50 * 1024 * 1024)
+
+# /api/batch: items per request, and items resolved (hashed/downloaded) concurrently
+BATCH_MAX_ITEMS = getattr(config, "BATCH_MAX_ITEMS", 1000)
+BATCH_CONCURRENCY = getattr(config, "BATCH_CONCURRENCY", 8)
+
+# Task status records (bounded, TTL-expired; optionally shared by worker processes)
+tasks = create_task_store()
+TASK_SWEEP_INTERVAL = getattr(config, "TASK_SWEEP_INTERVAL", 300)
+
+# Push task changes to /api/status/{task_id}/events subscribers
+task_events = TaskEvents()
+tasks.add_listener(task_events.notify)
+# Subscribers also re-read the store this often (seconds), which picks up
+# changes made by other worker processes and keeps the connection alive
+TASK_EVENTS_REFRESH = getattr(config, "TASK_EVENTS_REFRESH", 2.0)
+
+# Content-addressed PLY cache (TTL + size-bounded LRU, swept in the background)
+ply_cache = PlyCache(
+    config.CACHE_DIR,
+    ttl_seconds=config.CACHE_EXPIRY_DAYS * 86400,
+    max_bytes=getattr(config, "CACHE_MAX_BYTES", 20 * 1024 ** 3),
+)
+CACHE_SWEEP_INTERVAL = getattr(config, "CACHE_SWEEP_INTERVAL", 600)
+
+# OSS object key + ETag -> image hash, so repeat URLs skip the download
+oss_index = OssHashIndex(config.CACHE_DIR / "oss_index.sqlite3")
+
+# Cache keys come from the normalised pixels the model consumes (see
+# image_normalize.py); file bytes -> key is indexed so repeats skip decoding
+image_index = ImageKeyIndex(config.CACHE_DIR / "image_index.sqlite3")
+# Side of the square ml-sharp working resolution; inputs are downscaled to it
+MODEL_INPUT_SIZE = getattr(config, "MODEL_INPUT_SIZE", 1536)
+# Reuse the PLY of a perceptually similar image (Hamming distance in bits, 0 disables)
+PHASH_MAX_DISTANCE = getattr(config, "PHASH_MAX_DISTANCE", 0)
+
+# Optional second cache tier in OSS, shared by every backend node
+remote_cache = (
+    RemotePlyCache(ply_cache, getattr(config, "OSS_CACHE_PREFIX", "ml-sharp/ply-cache"))
+    if getattr(config, "OSS_CACHE_ENABLED", False) else None
+)
+# Redirect PLY downloads to signed OSS URLs (seconds of validity, 0 disables)
+OSS_SIGNED_URL_EXPIRE = getattr(config, "OSS_SIGNED_URL_EXPIRE", 0)
+
+# Optional pool of inference worker processes, one per config.INFERENCE_DEVICES slot
+inference_pool = create_inference_pool()
+# Run one throwaway prediction at startup, before /ready reports ready
+WARMUP_INFERENCE = getattr(config, "WARMUP_INFERENCE", True)
+
+# Served variants of new cache entries, built in the background
+artifact_builder = ArtifactBuilder(ply_cache, workers=getattr(config, "ARTIFACT_WORKERS", 1))
+# Preview thumbnails of new cache entries, rendered in the background on CPU
+preview_renderer = (
+    PreviewRenderer(ply_cache, size=getattr(config, "PREVIEW_SIZE", 256))
+    if getattr(config, "PREVIEW_ENABLED", True) else None
+)
+
+# Background PLY generation
+generation_queue = GenerationQueue(
+    tasks,
+    ply_cache,
+    workers=getattr(config, "GENERATION_WORKERS", inference_pool.size if inference_pool else 1),
+    batch_window=getattr(config, "GENERATION_BATCH_WINDOW_MS", 50) / 1000,
+    max_batch_size=getattr(config, "GENERATION_MAX_BATCH_SIZE", 8),
+    remote=remote_cache,
+    inference=inference_pool,
+    previews=preview_renderer,
+    artifacts=artifact_builder,
+    max_depth=getattr(config, "GENERATION_MAX_QUEUE", 64),
+    max_per_client=getattr(config, "GENERATION_MAX_PER_CLIENT", 0),
+)
+# Identify clients by the first X-Forwarded-For address (only behind a trusted proxy)
+TRUST_FORWARDED_FOR = getattr(config, "TRUST_FORWARDED_FOR", False)
+
+Gauge("mlsharp_queue_depth", "Generation jobs waiting for a worker.", callback=lambda: generation_queue.depth)
+Gauge("mlsharp_generations_active", "Distinct generations queued or running.", callback=lambda: generation_queue.active)
+Gauge("mlsharp_cache_bytes", "Bytes held by the local PLY cache.", callback=ply_cache.total_bytes)
+if inference_pool is not None:
+    Gauge(
+        "mlsharp_inference_worker_utilisation", "Busy fraction of each inference worker since startup.",
+        ["worker", "slot"],
+        callback=lambda: {(w["worker"], w["slot"]): w["utilisation"] for w in inference_pool.stats()},
+    )
+    Gauge(
+        "mlsharp_inference_worker_restarts", "Restarts of each inference worker after a crash.",
+        ["worker", "slot"],
+        callback=lambda: {(w["worker"], w["slot"]): w["restarts"] for w in inference_pool.stats()},
+    )
+
+
+_proxy_warned = False
+
+
+def _client_key(request: Request) -> Optional[str]:
+    """The address per-client generation limits are keyed by."""
+    global _proxy_warned
+    forwarded = request.headers.get("x-forwarded-for", "").split(",")[0].strip()
+    if TRUST_FORWARDED_FOR and forwarded:
+        return forwarded
+    host = request.client.host if request.client else None
+    if forwarded and generation_queue.max_per_client and not _proxy_warned:
+        try:
+            proxied = ipaddress.ip_address(host).is_private
+        except ValueError:
+            proxied = False
+        if proxied:
+            # Every user behind the proxy would share one quota
+            _proxy_warned = True
+            print(
+                f"Warning: requests arrive through a proxy at {host} but TRUST_FORWARDED_FOR is off, "
+                "so GENERATION_MAX_PER_CLIENT applies to all of its clients together"
+            )
+    return host
+
+
+def _submit_generation(
+    task_id: str,
+    upload_path: Optional[Path],
+    image_hash: str,
+    img_width,
+    img_height,
+    discard_input: bool = False,
+    client: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Resolve a task against the PLY cache, or queue it for generation.
+    Cache hits complete immediately and are never subject to admission
+    control; misses return with status 'queued', or raise 429 with a
+    Retry-After header when the queue or the `client`'s quota is full.
+    With `upload_path=None` the task can only be served from the cache or
+    attached to an in-flight generation of the same image; None is returned
+    otherwise. `discard_input` deletes the input image once it is no longer
+    needed (right away on a hit, after generation otherwise).
+    """
+    ply_filename = f"{image_hash}.ply"
+    
+    # Check cache: if cached PLY exists and not expired, use it directly
+    entry = ply_cache.lookup(image_hash)
+    if entry is None and upload_path is None and not generation_queue.in_flight(image_hash):
+        return None
+    if entry is not None:
+        CACHE_REQUESTS.inc(result="hit")
+        print(f"Cache hit for image hash {image_hash[:12]}... (age: {entry.age/3600:.1f}h)")
+        if discard_input and upload_path is not None:
+            upload_path.unlink(missing_ok=True)
+        
+        tasks.create(task_id, {
+            "status": "completed",
+            "stage": "ready",
+            "ply_filename": ply_filename,
+            "input_image": str(upload_path) if upload_path else None,
+            "image_width": img_width,
+            "image_height": img_height,
+            "cached": True
+        })
+        
+        return {
+            "task_id": task_id,
+            "ply_filename": ply_filename,
+            "status": "completed",
+            "image_width": img_width,
+            "image_height": img_height,
+            "cached": True
+        }
+    
+    try:
+        generation_queue.admit(image_hash, client)
+    except GenerationRejected as e:
+        print(f"Rejected task {task_id} for image hash {image_hash[:12]}...: {e}")
+        if upload_path is not None:
+            upload_path.unlink(missing_ok=True)
+        tasks.create(task_id, {"status": "failed", "stage": "failed", "error": str(e)})
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    # Queue PLY generation directly to cache
+    tasks.create(task_id, {
+        "status": "queued",
+        "stage": "queued",
+        "ply_filename": ply_filename,
+        "input_image": str(upload_path) if upload_path else None,
+        "image_width": img_width,
+        "image_height": img_height
+    })
+    job = GenerationJob(
+        task_id, upload_path, ply_cache.path_for(image_hash), image_hash, discard_input=discard_input
+    )
+    if generation_queue.submit(job, client) is not job:
+        # Attached to an in-flight generation of the same image
+        CACHE_REQUESTS.inc(result="attached")
+        if discard_input:
+            upload_path.unlink(missing_ok=True)
+    else:
+        CACHE_REQUESTS.inc(result="miss")
+    task = tasks.get(task_id) or {}
+    
+    return {
+        "task_id": task_id,
+        "ply_filename": ply_filename,
+        "status": task.get("status", "queued"),
+        "image_width": img_width,
+        "image_height": img_height
+    }
+
+
+def _near_duplicate_key(image: NormalizedImage) -> str:
+    """The cache key to use for an image: its own, or a cached near-duplicate's."""
+    if (
+        PHASH_MAX_DISTANCE <= 0
+        or ply_cache.contains(image.key)
+        or generation_queue.in_flight(image.key)
+    ):
+        return image.key
+    for key in image_index.nearest(image.phash, PHASH_MAX_DISTANCE):
+        if key != image.key and ply_cache.contains(key):
+            print(f"Near-duplicate of image hash {key[:12]}..., reusing its PLY")
+            return key
+    return image.key
+
+
+async def _submit_image(
+    task_id: str,
+    raw_path: Path,
+    file_hash: str,
+    input_dir: Path,
+    discard_input: bool = False,
+    client: Optional[str] = None,
+):
+    """
+    Resolve an ingested image file to its normalised cache key and submit it.
+    Files seen before are answered from the cache without decoding; otherwise
+    the image is normalised once into `input_dir` (the raw file is deleted)
+    and that copy is what the model receives. `client` is passed on to
+    `_submit_generation` for admission control.
+
+    Returns:
+        (result, normalised image identity)
+    """
+    loop = asyncio.get_running_loop()
+    known = await loop.run_in_executor(None, image_index.get, file_hash)
+    if known is not None:
+        try:
+            result = _submit_generation(task_id, None, known.key, known.width, known.height, client=client)
+        except HTTPException:
+            raw_path.unlink(missing_ok=True)
+            raise
+        if result is not None:
+            raw_path.unlink(missing_ok=True)
+            return result, known
+
+    tasks.create(task_id, {"status": "queued", "stage": "hashing"})
+    input_path = input_dir / f"{task_id}.png"
+    try:
+        with STAGE_SECONDS.time(stage="hash"):
+            image = await loop.run_in_executor(
+                None, normalize_image, raw_path, input_path, MODEL_INPUT_SIZE
+            )
+    except Exception as e:
+        input_path.unlink(missing_ok=True)
+        print(f"Failed to decode image for task {task_id}: {e}")
+        tasks.update(task_id, status="failed", stage="failed", error="Invalid image file")
+        raise HTTPException(status_code=400, detail="Invalid image file")
+    finally:
+        raw_path.unlink(missing_ok=True)
+    await loop.run_in_executor(None, image_index.put, file_hash, image)
+
+    key = await loop.run_in_executor(None, _near_duplicate_key, image)
+    result = _submit_generation(
+        task_id, input_path, key, image.width, image.height, discard_input=discard_input, client=client
+    )
+    return result, image
+
+
+@app.on_event("startup")
+async def startup_cache_sweeper():
+    """Expire and evict PLY cache entries periodically in the background."""
+    app.state.cache_sweeper = asyncio.create_task(ply_cache.run_sweeper(CACHE_SWEEP_INTERVAL))
+
 
-# Store processing tasks
-tasks: Dict[str, dict] = {}
+@app.on_event("shutdown")
+async def shutdown_cache_sweeper():
+    """Stop the PLY cache sweeper."""
+    app.state.cache_sweeper.cancel()
 
 
-def _file_hash(file_path: Path) -> str:
-    """Compute SHA-256 hash of a file's content."""
-    h = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
+@app.on_event("startup")
+async def startup_image_index_pruner():
+    """Forget image keys whose PLY has left the cache, on the cache sweep interval."""
+    app.state.image_index_pruner = asyncio.create_task(
+        image_index.run_pruner(CACHE_SWEEP_INTERVAL, ply_cache.contains)
+    )
+
+
+@app.on_event("shutdown")
+async def shutdown_image_index_pruner():
+    """Stop the image index pruner."""
+    app.state.image_index_pruner.cancel()
+
+
+@app.on_event("startup")
+async def startup_task_sweeper():
+    """Drop expired task records periodically in the background."""
+    app.state.task_sweeper = asyncio.create_task(tasks.run_sweeper(TASK_SWEEP_INTERVAL))
+
+
+@app.on_event("shutdown")
+async def shutdown_task_sweeper():
+    """Stop the task store sweeper."""
+    app.state.task_sweeper.cancel()
+
+
+@app.on_event("startup")
+async def startup_inference_warm_up():
+    """Load (and warm up) the in-process model in the background; see /ready."""
+    if inference_pool is not None:
+        return  # workers load their own models once started
 
+    async def warm_up():
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, initialise_service, WARMUP_INFERENCE)
+            print("ml-sharp service ready")
+        except Exception as e:
+            print(f"ml-sharp service failed to initialise: {e}")
 
-def _cleanup_expired_cache():
-    """Delete cache files older than CACHE_EXPIRY_DAYS."""
-    expiry_seconds = config.CACHE_EXPIRY_DAYS * 86400
-    now = time.time()
-    count = 0
-    for f in config.CACHE_DIR.iterdir():
-        if f.is_file() and f.suffix == ".ply":
-            if now - f.stat().st_mtime > expiry_seconds:
-                f.unlink()
-                count += 1
-    if count:
-        print(f"Cleaned up {count} expired PLY cache file(s)")
+    app.state.warm_up = asyncio.create_task(warm_up())
 
 
 @app.on_event("startup")
-async def startup_cleanup():
-    """Clean expired PLY cache on startup."""
-    _cleanup_expired_cache()
+async def startup_generation_queue():
+    """Start background generation workers."""
+    if inference_pool is not None:
+        await asyncio.get_running_loop().run_in_executor(None, inference_pool.start)
+    await generation_queue.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_generation_queue():
+    """Stop background generation workers."""
+    await generation_queue.stop()
+    if inference_pool is not None:
+        await asyncio.get_running_loop().run_in_executor(None, inference_pool.close)
+    if remote_cache is not None:
+        await asyncio.get_running_loop().run_in_executor(None, remote_cache.close)
+    await asyncio.get_running_loop().run_in_executor(None, artifact_builder.close)
+    if preview_renderer is not None:
+        await asyncio.get_running_loop().run_in_executor(None, preview_renderer.close)
 
 
 @app.get("/")
@@ -63,235 +396,391 @@ async def root():
     return {"status": "ok", "message": "ML-Sharp API is running"}
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once the inference engine is loaded and warm, 503 until then."""
+    state = inference_pool.readiness() if inference_pool is not None else readiness()
+    if state["status"] != "ready":
+        return JSONResponse(state, status_code=503)
+    return state
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics for this process."""
+    return Response(render(), media_type=CONTENT_TYPE)
+
+
 @app.post("/api/upload")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(request: Request, file: UploadFile = File(...)):
     """
     Upload an image and generate PLY file.
-    Uses content-based caching: same image returns cached PLY (valid for 7 days).
+    Uses content-based caching: the same picture (by normalised pixels, not
+    file bytes) returns the cached PLY (valid for 7 days).
+    Cache misses are generated in the background; poll /api/status/{task_id}.
+    Misses are refused with 429 and Retry-After while the generation queue
+    or this client's quota is full.
     
     Returns:
-        JSON with task_id and ply_filename
+        JSON with task_id, ply_filename and status ('completed' or 'queued')
     """
+    # Generate unique task ID
+    task_id = str(uuid.uuid4())
+    upload_path, file_hash = await _save_upload(task_id, file)
+    result, _ = await _submit_image(
+        task_id, upload_path, file_hash, config.UPLOAD_DIR, client=_client_key(request)
+    )
+    return result
+
+
+async def _save_upload(task_id: str, file: UploadFile):
+    """Validate and store an uploaded file, returning (raw path, SHA-256 of its bytes)."""
     # Validate file extension
-    file_ext = Path(file.filename).suffix.lower()
+    file_ext = Path(file.filename or "").suffix.lower()
     if file_ext not in config.ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
             detail=f"Invalid file type. Allowed: {', '.join(config.ALLOWED_EXTENSIONS)}"
         )
     
-    # Generate unique task ID
-    task_id = str(uuid.uuid4())
-    
-    # Save uploaded file
-    upload_path = config.UPLOAD_DIR / f"{task_id}{file_ext}"
+    # Save uploaded file, hashing it in the same pass
+    upload_path = config.UPLOAD_DIR / f"{task_id}.raw{file_ext}"
     try:
-        with upload_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        with STAGE_SECONDS.time(stage="upload"):
+            upload = await ingest_upload(file, upload_path, max_bytes=MAX_UPLOAD_BYTES)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size: {MAX_UPLOAD_BYTES // (1024 * 1024)}MB"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-    
-    # Get image dimensions
-    try:
-        with Image.open(upload_path) as img:
-            img_width, img_height = img.size
-    except Exception:
-        img_width, img_height = None, None
-    
-    # Compute image hash for cache lookup
-    image_hash = _file_hash(upload_path)
-    ply_filename = f"{image_hash}.ply"
-    cache_path = config.CACHE_DIR / ply_filename
-    
-    # Check cache: if cached PLY exists and not expired, use it directly
-    expiry_seconds = config.CACHE_EXPIRY_DAYS * 86400
-    if cache_path.exists():
-        age = time.time() - cache_path.stat().st_mtime
-        if age < expiry_seconds:
-            print(f"Cache hit for image hash {image_hash[:12]}... (age: {age/3600:.1f}h)")
-            
-            tasks[task_id] = {
-                "status": "completed",
-                "ply_filename": ply_filename,
-                "input_image": str(upload_path),
-                "image_width": img_width,
-                "image_height": img_height,
-                "cached": True
-            }
-            
-            return JSONResponse({
-                "task_id": task_id,
-                "ply_filename": ply_filename,
-                "status": "completed",
-                "image_width": img_width,
-                "image_height": img_height,
-                "cached": True
-            })
-        else:
-            # Expired, delete stale cache
-            cache_path.unlink()
-            print(f"Cache expired for image hash {image_hash[:12]}..., regenerating")
-    
-    # Generate PLY file directly to cache
-    try:
-        service = get_service()
-        service.generate_ply(upload_path, cache_path)
-        
-        print(f"Generated and cached PLY for image hash {image_hash[:12]}...")
-        
-        tasks[task_id] = {
-            "status": "completed",
-            "ply_filename": ply_filename,
-            "input_image": str(upload_path),
-            "image_width": img_width,
-            "image_height": img_height
-        }
-        
-        return JSONResponse({
-            "task_id": task_id,
-            "ply_filename": ply_filename,
-            "status": "completed",
-            "image_width": img_width,
-            "image_height": img_height
-        })
-        
-    except Exception as e:
-        tasks[task_id] = {
-            "status": "failed",
-            "error": str(e)
-        }
-        raise HTTPException(status_code=500, detail=f"Failed to generate PLY: {str(e)}")
+    return upload_path, upload.sha256
 
 
 class OSSUrlRequest(BaseModel):
     url: str
 
 @app.post("/api/generate_from_oss_url")
-async def generate_from_oss_url(request: OSSUrlRequest):
+async def generate_from_oss_url(request: Request, body: OSSUrlRequest):
     """
     Generate PLY file from an Aliyun OSS image URL.
     Downloads the image locally, then uses the same content-based caching logic.
+    Object versions seen before (same key and ETag) skip the download entirely.
     """
-    oss_url = request.url
+    return await _generate_from_oss(body.url, client=_client_key(request))
+
+
+async def _generate_from_oss(oss_url: str, client: Optional[str] = None) -> dict:
+    """Resolve an OSS image URL to a task (see generate_from_oss_url)."""
     if not oss_url:
         raise HTTPException(status_code=400, detail="URL is required")
 
+    # Validate file extension before downloading anything
+    file_ext = Path(urlparse(oss_url).path).suffix.lower()
+    if file_ext not in config.ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type {file_ext}. Allowed: {', '.join(config.ALLOWED_EXTENSIONS)}"
+        )
+
     task_id = str(uuid.uuid4())
+    loop = asyncio.get_running_loop()
+    oss_svc = get_oss_service()
     
-    # Initialize OSS service
-    oss_svc = OSSService(config.OSS_CONFIG)
+    # One HEAD request: if this object version was seen before, resolve it
+    # to its content hash and answer from the cache without downloading
+    info = await loop.run_in_executor(None, oss_svc.head, oss_url)
+    if info is None:
+        raise HTTPException(status_code=400, detail="Failed to download file from OSS URL")
+    known = await loop.run_in_executor(None, oss_index.get, info.key, info.etag)
+    if known is not None:
+        result = _submit_generation(
+            task_id, None, known.image_hash, known.width, known.height, client=client
+        )
+        if result is not None:
+            return result
     
-    # Download file to temp dir
-    local_path_str = oss_svc.download_file(oss_url, str(config.OSS_TEMP_DIR))
-    if not local_path_str:
+    # Download file to temp dir off the event loop, hashing it while it is written
+    tasks.create(task_id, {"status": "queued", "stage": "downloading"})
+    upload_path = config.OSS_TEMP_DIR / f"{task_id}.raw{file_ext}"
+    with STAGE_SECONDS.time(stage="oss_download"):
+        download = await loop.run_in_executor(
+            None, oss_svc.download_with_hash, oss_url, str(upload_path), info.size
+        )
+    if download is None:
+        tasks.update(task_id, status="failed", stage="failed", error="Failed to download file from OSS URL")
         raise HTTPException(status_code=400, detail="Failed to download file from OSS URL")
         
-    upload_path = Path(local_path_str)
-    
-    # Validate file extension
-    file_ext = upload_path.suffix.lower()
-    if file_ext not in config.ALLOWED_EXTENSIONS:
-        if upload_path.exists():
-            upload_path.unlink()
+    # The normalised temp copy is deleted as soon as it has been used
+    result, image = await _submit_image(
+        task_id, upload_path, download.sha256, config.OSS_TEMP_DIR, discard_input=True, client=client
+    )
+    await loop.run_in_executor(
+        None, oss_index.put, info.key, info.etag,
+        OssImageRecord(image.key, image.width, image.height),
+    )
+    return result
+
+
+@app.post("/api/batch")
+async def generate_batch(
+    request: Request,
+    files: List[UploadFile] = File(default=[]),
+    urls: List[str] = Form(default=[]),
+):
+    """
+    Generate PLYs for many uploaded files and/or OSS URLs in one request.
+    Every item becomes a task exactly as with /api/upload and
+    /api/generate_from_oss_url, so identical images share one generation
+    and cache hits resolve immediately; misses reach the generation queue
+    together and are batched into model invocations.
+    Misses count against the client's generation quota
+    (GENERATION_MAX_PER_CLIENT); items refused by admission control fail
+    with a `retry_after` (seconds) on their line.
+
+    Returns:
+        NDJSON stream with one line per item, in completion order, once the
+        item is 'completed' or 'failed' (the line carries the item's `index`:
+        files first, then URLs)
+    """
+    if len(files) + len(urls) > BATCH_MAX_ITEMS:
         raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type {file_ext}. Allowed: {', '.join(config.ALLOWED_EXTENSIONS)}"
+            status_code=413,
+            detail=f"Too many items. Maximum per batch: {BATCH_MAX_ITEMS}"
         )
-        
-    # Get image dimensions
-    try:
-        with Image.open(upload_path) as img:
-            img_width, img_height = img.size
-    except Exception:
-        img_width, img_height = None, None
-        
-    # Compute image hash for cache lookup
-    image_hash = _file_hash(upload_path)
-    ply_filename = f"{image_hash}.ply"
-    cache_path = config.CACHE_DIR / ply_filename
     
-    # Check cache: if cached PLY exists and not expired, use it directly
-    expiry_seconds = config.CACHE_EXPIRY_DAYS * 86400
-    if cache_path.exists():
-        age = time.time() - cache_path.stat().st_mtime
-        if age < expiry_seconds:
-            print(f"Cache hit for image hash {image_hash[:12]}... (age: {age/3600:.1f}h)")
-            
-            tasks[task_id] = {
-                "status": "completed",
-                "ply_filename": ply_filename,
-                "input_image": str(upload_path),
-                "image_width": img_width,
-                "image_height": img_height,
-                "cached": True
-            }
-            
-            return JSONResponse({
-                "task_id": task_id,
-                "ply_filename": ply_filename,
-                "status": "completed",
-                "image_width": img_width,
-                "image_height": img_height,
-                "cached": True
-            })
-        else:
-            # Expired, delete stale cache
-            cache_path.unlink()
-            print(f"Cache expired for image hash {image_hash[:12]}..., regenerating")
-            
-    # Generate PLY file directly to cache
-    try:
-        service = get_service()
-        service.generate_ply(upload_path, cache_path)
-        
-        print(f"Generated and cached PLY for image hash {image_hash[:12]}...")
-        
-        tasks[task_id] = {
-            "status": "completed",
-            "ply_filename": ply_filename,
-            "input_image": str(upload_path),
-            "image_width": img_width,
-            "image_height": img_height
-        }
-        
-        return JSONResponse({
-            "task_id": task_id,
-            "ply_filename": ply_filename,
-            "status": "completed",
-            "image_width": img_width,
-            "image_height": img_height
-        })
-        
-    except Exception as e:
-        tasks[task_id] = {
-            "status": "failed",
-            "error": str(e)
-        }
-        raise HTTPException(status_code=500, detail=f"Failed to generate PLY: {str(e)}")
+    # Uploaded files are only readable until this handler returns, so store
+    # them all before streaming; failures are reported on the item's line
+    saved = []
+    for file in files:
+        task_id = str(uuid.uuid4())
+        try:
+            saved.append((task_id, file.filename, await _save_upload(task_id, file), None))
+        except HTTPException as e:
+            saved.append((task_id, file.filename, None, e.detail))
+    
+    client = _client_key(request)
+    # Bounds submission (hashing, cache lookup) only; generations are waited
+    # for outside it, so misses reach the queue together and hits never wait
+    semaphore = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+    
+    async def resolve(index: int, source: dict, submit) -> dict:
+        try:
+            async with semaphore:
+                result = await submit()
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            line = {"index": index, **source, "status": "failed", "error": error}
+            retry_after = (getattr(e, "headers", None) or {}).get("Retry-After")
+            if retry_after is not None:
+                line["retry_after"] = int(retry_after)
+            return line
+        if result["status"] != "completed":
+            await generation_queue.wait(result["ply_filename"][:-len(".ply")])
+            task = tasks.get(result["task_id"]) or {}
+            result = {**result, "status": task.get("status", "failed"), "error": task.get("error")}
+        return {"index": index, **source, **{k: v for k, v in result.items() if v is not None}}
+    
+    # Uploads handed to _submit_image; it owns (and eventually deletes) them from then on
+    submitted = set()
+    
+    async def submit_file(task_id: str, upload_path: Path, file_hash: str) -> dict:
+        submitted.add(task_id)
+        result, _ = await _submit_image(task_id, upload_path, file_hash, config.UPLOAD_DIR, client=client)
+        return result
+    
+    async def stream():
+        pending = []
+        for index, (task_id, filename, upload, error) in enumerate(saved):
+            if error is not None:
+                yield json.dumps({"index": index, "file": filename, "status": "failed", "error": error}) + "\n"
+                continue
+            pending.append(asyncio.ensure_future(
+                resolve(index, {"file": filename}, lambda t=task_id, u=upload: submit_file(t, *u))
+            ))
+        for offset, url in enumerate(urls):
+            pending.append(asyncio.ensure_future(
+                resolve(len(saved) + offset, {"url": url}, lambda u=url: _generate_from_oss(u, client))
+            ))
+        try:
+            for next_done in asyncio.as_completed(pending):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: stop resolving; queued generations still complete
+            for future in pending:
+                future.cancel()
+            for task_id, _, upload, _ in saved:
+                if upload is not None and task_id not in submitted:
+                    upload[0].unlink(missing_ok=True)
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 @app.get("/api/ply/{filename}")
-async def get_ply_file(filename: str):
-    """Serve PLY file from cache."""
-    file_path = config.CACHE_DIR / filename
+async def get_ply_file(
+    request: Request,
+    filename: str,
+    format: str = "ply",
+    max_splats: Optional[int] = None,
+    lod: Optional[str] = None,
+):
+    """
+    Serve PLY file from cache.
+    `format=csplat` serves the compact quantised splat encoding instead
+    (see splat_codec.py), which is about 3.5x smaller than the raw PLY.
+    `max_splats=N` or `lod=low|medium|high` serve a reduced variant with
+    at most that many gaussians (see splat_decimate.py), built on first
+    request and cached per level.
+    Files are content-addressed, so responses carry a strong ETag and
+    immutable caching, and support Range and precompressed encodings.
+    With OSS_SIGNED_URL_EXPIRE set, PLYs published to the shared OSS cache
+    are redirected to a signed OSS URL instead of being served by this node.
+    """
+    if format not in FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid format. Allowed: {', '.join(FORMATS)}"
+        )
+    try:
+        level = resolve_level(max_splats, lod)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    image_hash = filename[:-len(".ply")] if filename.endswith(".ply") else ""
+    entry = ply_cache.lookup(image_hash) if is_cache_key(image_hash) else None
     
-    if not file_path.exists():
+    if entry is None:
         raise HTTPException(status_code=404, detail="PLY file not found")
     
-    return FileResponse(
+    if remote_cache is not None and OSS_SIGNED_URL_EXPIRE and level is None:
+        signed_url = remote_cache.signed_url(image_hash, format, OSS_SIGNED_URL_EXPIRE)
+        if signed_url is not None:
+            return RedirectResponse(signed_url, status_code=307)
+    
+    file_path = entry.path
+    loop = asyncio.get_running_loop()
+    if level is not None:
+        file_path, level = await loop.run_in_executor(
+            None, ensure_decimated, ply_cache, image_hash, format, level
+        )
+    elif format != "ply":
+        file_path = await loop.run_in_executor(None, ensure_format, ply_cache, image_hash, format)
+    
+    variant = format if level is None else f"{format}.s{level}"
+    return cached_file_response(
+        request,
         file_path,
+        etag=f'"{image_hash}.{variant}"',
         media_type="application/octet-stream",
-        filename=filename
+        filename=file_path.name
+    )
+
+
+@app.get("/api/ply/{filename}/meta")
+async def get_ply_meta(request: Request, filename: str):
+    """
+    Small JSON summary of a cached PLY, computed at cache time: vertex
+    count, property layout, bounds, robust centroid, scale and opacity
+    percentiles and byte size (see ply_meta.py). Lets clients frame the
+    scene and size progress before downloading the splats.
+    """
+    image_hash = filename[:-len(".ply")] if filename.endswith(".ply") else ""
+    entry = ply_cache.lookup(image_hash) if is_cache_key(image_hash) else None
+    if entry is None:
+        raise HTTPException(status_code=404, detail="PLY file not found")
+
+    meta_path = await asyncio.get_running_loop().run_in_executor(None, ensure_meta, ply_cache, image_hash)
+    return cached_file_response(
+        request,
+        meta_path,
+        etag=f'"{image_hash}.meta"',
+        media_type="application/json"
+    )
+
+
+@app.get("/api/thumbnail/{image_hash}")
+async def get_thumbnail(request: Request, image_hash: str):
+    """
+    Preview image of a cached PLY, rendered from the source camera at
+    PREVIEW_SIZE pixels on the longest side (WebP, or PNG where Pillow
+    lacks WebP support; see splat_preview.py). Rendered in the background
+    when the PLY is cached, or on first request if it is not there yet.
+    """
+    entry = ply_cache.lookup(image_hash) if is_cache_key(image_hash) else None
+    if entry is None or preview_renderer is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+
+    thumbnail_path = await asyncio.get_running_loop().run_in_executor(None, preview_renderer.ensure, image_hash)
+    return cached_file_response(
+        request,
+        thumbnail_path,
+        etag=f'"{image_hash}.thumb"',
+        media_type=THUMBNAIL_MEDIA_TYPE
     )
 
 
 @app.get("/api/status/{task_id}")
 async def get_task_status(task_id: str):
     """Get processing status for a task."""
-    if task_id not in tasks:
+    task = tasks.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    return tasks[task_id]
+    return task
+
+
+@app.get("/api/status/{task_id}/events")
+async def get_task_events(task_id: str):
+    """
+    Stream a task's progress as Server-Sent Events instead of polling.
+    Each change sends the full task record (as /api/status returns it);
+    `stage` moves through downloading, hashing, queued, inferring,
+    sanitising and ready (or failed). The stream ends after the final
+    record, which carries `ply_filename` and the image dimensions.
+    """
+    if tasks.get(task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    async def stream():
+        last = None
+        with task_events.subscribe(task_id) as changed:
+            while True:
+                # Clear before reading, so a change made after the read wakes us
+                changed.clear()
+                task = tasks.get(task_id)
+                if task is None:
+                    yield f"event: error\ndata: {json.dumps({'detail': 'Task not found'})}\n\n"
+                    return
+                if task != last:
+                    yield f"data: {json.dumps({'task_id': task_id, **task})}\n\n"
+                    last = task
+                    if task.get("status") in ("completed", "failed"):
+                        return
+                else:
+                    yield ": keep-alive\n\n"
+                try:
+                    await asyncio.wait_for(changed.wait(), TASK_EVENTS_REFRESH)
+                except asyncio.TimeoutError:
+                    pass
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/workers")
+async def list_workers():
+    """Inference worker processes with their device slot and utilisation (empty when inference runs in-process)."""
+    return inference_pool.stats() if inference_pool is not None else []
+
+
+@app.get("/api/tasks")
+async def list_tasks(status: Optional[str] = None, limit: int = 100):
+    """List the most recently updated tasks, optionally filtered by status."""
+    limit = max(1, min(limit, 1000))
+    return [{"task_id": task_id, **task} for task_id, task in tasks.list(status, limit)]
 
 
 if __name__ == "__main__":
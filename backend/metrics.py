@@ -0,0 +1,233 @@
+import bisect
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Minimal Prometheus instrumentation (text exposition format 0.0.4).
+# Values are per process; with several uvicorn workers, scrape each one
+# or aggregate by instance.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = tuple(2 ** i for i in range(16, 31))  # 64KB .. 1GB
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Exposition lines for every labelled series of this metric."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """
+    A gauge that is either set directly or read from `callback` at scrape
+    time. A labelled gauge's callback returns {label values tuple: value}.
+    """
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        callback: Optional[Callable[[], float]] = None,
+    ):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                print(f"Metric {self.name} callback failed: {e}")
+                return []
+            if not self.label_names:
+                return [f"{self.name} {_format_value(value)}"]
+            items = sorted(value.items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            if index < len(counts):
+                counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(c), s, n)) for k, (c, s, n) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests by route template and timing them
+    until the last body chunk is sent, so file downloads include transfer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUESTS.inc(method=scope["method"], route=path, status=status["code"])
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=path)
+
+
+# Metrics shared across modules
+HTTP_REQUESTS = Counter(
+    "mlsharp_http_requests_total", "HTTP requests by route template and status.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "mlsharp_http_request_duration_seconds",
+    "HTTP request duration including the response body, by route template.",
+    ["route"],
+)
+STAGE_SECONDS = Histogram(
+    "mlsharp_stage_duration_seconds",
+    "Duration of processing stages: upload, hash, oss_download, inference, sanitise, finalise, preview.",
+    ["stage"],
+)
+CACHE_REQUESTS = Counter(
+    "mlsharp_cache_requests_total",
+    "Generation requests by cache tier outcome: hit, miss, remote_hit, attached.",
+    ["result"],
+)
+ADMISSION_REJECTIONS = Counter(
+    "mlsharp_admission_rejections_total",
+    "Tasks turned away by admission control (HTTP 429), by reason: queue_full, client_limit.",
+    ["reason"],
+)
+GENERATIONS = Counter(
+    "mlsharp_generations_total", "Finished PLY generations by outcome.", ["result"],
+)
+PLY_SIZE_BYTES = Histogram(
+    "mlsharp_ply_size_bytes", "Size of generated PLY files.", buckets=SIZE_BUCKETS,
+)
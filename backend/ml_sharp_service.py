@@ -1,11 +1,28 @@
+import importlib.util
 import os
+import shutil
 import subprocess
 import sys
+import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Optional
-import torch
+from typing import List, Optional, Tuple
 from PIL import Image
 import config
+from metrics import STAGE_SECONDS
+from sharp_engine import create_engine
+
+
+ML_SHARP_INSTALL = "pip install git+https://github.com/apple/ml-sharp.git"
+
+
+def _link_or_copy(src: Path, dst: Path):
+    """Hardlink src to dst, copying only when linking is not possible (e.g. across filesystems)."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
 
 
 class MLSharpService:
@@ -13,21 +30,40 @@ class MLSharpService:
     
     def __init__(self):
         self.model_path = config.MODEL_CHECKPOINT_PATH
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self._ensure_sharp_installed()
+        self.device = self._detect_device()
+        self._check_sharp_installed()
         self._ensure_model_downloaded()
-    
-    def _ensure_sharp_installed(self):
-        """Ensure ml-sharp is installed."""
+        self.engine = create_engine(self.device)
+        if self.engine is not None:
+            try:
+                self.engine.load()
+            except Exception as e:
+                if getattr(config, "SHARP_ENGINE_MODE", "auto") == "resident":
+                    raise
+                print(f"Resident engine failed to load ({e}), falling back to `sharp predict` CLI")
+                self.engine = None
+
+    @staticmethod
+    def _detect_device() -> str:
+        """CUDA when torch can see a GPU; torch is only imported here, not at module import."""
         try:
-            import sharp
+            import torch
         except ImportError:
-            print("Installing ml-sharp...")
-            subprocess.check_call([
-                sys.executable, "-m", "pip", "install",
-                "git+https://ghfast.top/https://github.com/apple/ml-sharp.git"
-            ])
-    
+            return "cpu"
+        return "cuda" if torch.cuda.is_available() else "cpu"
+
+    def _check_sharp_installed(self):
+        """Fail fast when neither the ml-sharp package nor the `sharp` CLI is installed."""
+        if importlib.util.find_spec("sharp") is None and not os.path.exists(_resolve_sharp_cmd()):
+            raise RuntimeError(f"ml-sharp is not installed; install it with `{ML_SHARP_INSTALL}`")
+
+    def warm_up(self):
+        """Run one throwaway prediction so the first request does not pay for lazy initialisation."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            image_path = Path(temp_dir) / "warmup.png"
+            Image.new("RGB", (256, 256), (127, 127, 127)).save(image_path)
+            self.generate_ply(image_path, Path(temp_dir) / "warmup.ply")
+
     def _ensure_model_downloaded(self):
         """Download model checkpoint if not exists."""
         if self.model_path.exists():
@@ -53,6 +89,7 @@ class MLSharpService:
     def generate_ply(self, image_path: Path, output_path: Path) -> Path:
         """
         Generate PLY file from input image using ml-sharp.
+        Uses the resident engine when available, otherwise the `sharp predict` CLI.
         
         Args:
             image_path: Path to input image
@@ -61,139 +98,224 @@ class MLSharpService:
         Returns:
             Path to generated PLY file
         """
-        import tempfile
-        import shutil
+        if self.engine is not None:
+            try:
+                self.engine.predict(image_path, output_path)
+                with STAGE_SECONDS.time(stage="sanitise"):
+                    self._sanitize_ply(output_path)
+                return output_path
+            except Exception as e:
+                if getattr(config, "SHARP_ENGINE_MODE", "auto") == "resident":
+                    raise RuntimeError(f"Failed to generate PLY: {e}")
+                print(f"Resident engine failed ({e}), falling back to sharp CLI")
         
+        error = self._generate_ply_cli([(image_path, output_path)])[0]
+        if error is not None:
+            raise error
+        return output_path
+
+    def generate_ply_batch(self, jobs: List[Tuple[Path, Path]]) -> List[Optional[Exception]]:
+        """
+        Generate PLY files for several images in one model invocation.
+        
+        Args:
+            jobs: (image_path, output_path) pairs
+            
+        Returns:
+            Per-job error, or None where the PLY was generated
+        """
+        if self.engine is not None:
+            # The resident model is already warm, so batching only saves the lock round trips
+            errors = []
+            for image_path, output_path in jobs:
+                try:
+                    self.generate_ply(image_path, output_path)
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(e)
+            return errors
+        
+        errors = self._generate_ply_cli(jobs)
+        if len(jobs) > 1 and all(isinstance(e, RuntimeError) for e in errors):
+            # The whole predict run failed; retry one by one so a single bad
+            # image does not fail every request batched with it
+            print(f"Batch of {len(jobs)} failed, retrying images individually")
+            errors = [self._generate_ply_cli([job])[0] for job in jobs]
+        return errors
+
+    def _generate_ply_cli(self, jobs: List[Tuple[Path, Path]]) -> List[Optional[Exception]]:
+        """
+        Generate PLY files by running the `sharp predict` CLI once over all images.
+        
+        Returns:
+            Per-job error, or None where the PLY was generated
+        """
         try:
-            # Create a temporary directory for this single image
+            # Create a temporary directory holding only this batch's images
             # This prevents sharp from processing all images in uploads/
-            with tempfile.TemporaryDirectory() as temp_dir:
+            # It lives inside the cache dir so outputs can be renamed, not copied, into place
+            staging_dir = config.CACHE_DIR / ".staging"
+            staging_dir.mkdir(exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=staging_dir) as temp_dir:
                 temp_path = Path(temp_dir)
                 temp_input_dir = temp_path / "input"
                 temp_output_dir = temp_path / "output"
                 temp_input_dir.mkdir()
                 temp_output_dir.mkdir()
                 
-                # Copy only the target image to temp input
-                temp_image = temp_input_dir / image_path.name
-                shutil.copy2(image_path, temp_image)
+                # Link the target images into temp input, named by batch index
+                # so identical upload names cannot collide
+                for index, (image_path, _) in enumerate(jobs):
+                    _link_or_copy(image_path, temp_input_dir / f"{index}{image_path.suffix}")
                 
-                # Resolve sharp executable path
-                sharp_cmd = shutil.which("sharp")
-                if not sharp_cmd:
-                    bin_dir = os.path.dirname(sys.executable)
-                    if os.name == 'nt':
-                        sharp_cmd = os.path.join(bin_dir, "Scripts", "sharp.exe")
-                        if not os.path.exists(sharp_cmd):
-                            sharp_cmd = os.path.join(bin_dir, "sharp.exe")
-                    else:
-                        sharp_cmd = os.path.join(bin_dir, "sharp")
-                        
-                if not sharp_cmd or not os.path.exists(sharp_cmd):
-                    sharp_cmd = "sharp"  # fallback
-
                 # Run sharp predict command on temp directory
                 cmd = [
-                    sharp_cmd, "predict",
+                    _resolve_sharp_cmd(), "predict",
                     "-i", str(temp_input_dir),
                     "-o", str(temp_output_dir),
                     "-c", str(self.model_path)
                 ]
                 
                 print(f"Running command: {' '.join(cmd)}")
+                # The run is killed if it hangs; the budget grows with the batch
+                timeout = getattr(config, "INFERENCE_TIMEOUT", 300) * len(jobs) or None
                 result = subprocess.run(
                     cmd,
                     capture_output=True,
                     text=True,
-                    check=True
+                    check=True,
+                    timeout=timeout
                 )
                 
                 print(f"Sharp output: {result.stdout}")
                 if result.stderr:
                     print(f"Sharp stderr: {result.stderr}")
                 
-                # The output PLY file will have the same name as input image
-                expected_ply = temp_output_dir / f"{image_path.stem}.ply"
-                
-                if not expected_ply.exists():
-                    raise FileNotFoundError(f"Expected PLY file not found: {expected_ply}")
-                
-                # Copy the generated PLY to the final output location
-                shutil.copy2(expected_ply, output_path)
-            
-            # Sanitize the PLY to ensure compatibility with gsplat (fix 'uint' type)
-            self._sanitize_ply(output_path)
+                errors: List[Optional[Exception]] = []
+                for index, (_, output_path) in enumerate(jobs):
+                    # The output PLY file will have the same name as input image
+                    expected_ply = temp_output_dir / f"{index}.ply"
+                    
+                    if not expected_ply.exists():
+                        errors.append(FileNotFoundError(f"Expected PLY file not found: {expected_ply}"))
+                        continue
+                    
+                    # Move the generated PLY to the final output location
+                    # (a rename on the same filesystem)
+                    shutil.move(expected_ply, output_path)
+                    
+                    # Sanitize the PLY to ensure compatibility with gsplat (fix 'uint' type)
+                    with STAGE_SECONDS.time(stage="sanitise"):
+                        self._sanitize_ply(output_path)
+                    errors.append(None)
             
-            return output_path
+            return errors
             
         except subprocess.CalledProcessError as e:
             print(f"Error running sharp: {e.stderr}")
-            raise RuntimeError(f"Failed to generate PLY: {e.stderr}")
+            return [RuntimeError(f"Failed to generate PLY: {e.stderr}") for _ in jobs]
+        except subprocess.TimeoutExpired as e:
+            # Not a RuntimeError: a batch that timed out is not retried image by image
+            print(f"sharp predict timed out after {e.timeout:.0f}s, killed")
+            return [TimeoutError(f"Failed to generate PLY: timed out after {e.timeout:.0f}s") for _ in jobs]
         except Exception as e:
             print(f"Unexpected error: {e}")
-            raise
+            return [e for _ in jobs]
 
     def _sanitize_ply(self, ply_path: Path):
         """
         Sanitize PLY file header to ensure compatibility with gsplat.
         Replaces unsupported 'uint' type with 'int' (both are 4 bytes).
+        The header is patched in place: 'property int ' is padded with a
+        space to the length of 'property uint ', so the body never moves.
         """
-        import shutil
         try:
-            temp_path = ply_path.with_suffix(".ply.tmp")
-            
-            with open(ply_path, 'rb') as f_in, open(temp_path, 'wb') as f_out:
+            with open(ply_path, 'r+b') as f:
                 # Read header
                 header_lines = []
                 while True:
-                    line = f_in.readline()
+                    line = f.readline()
+                    if not line:
+                        print("Warning: PLY header has no end_header, skipping sanitization")
+                        return
                     header_lines.append(line)
                     if line.strip() == b"end_header":
                         break
                     if len(header_lines) > 1000: # Safety break
                         print("Warning: PLY header too long, skipping sanitization")
-                        # Write what we read so far and copy rest
-                        for h in header_lines: f_out.write(h)
-                        shutil.copyfileobj(f_in, f_out)
                         return
 
-                # Process header
-                new_header = []
-                for line in header_lines:
-                    try:
-                        line_str = line.decode('utf-8')
-                        if line_str.strip().startswith('property uint '):
-                            line_str = line_str.replace('property uint ', 'property int ')
-                        new_header.append(line_str.encode('utf-8'))
-                    except:
-                        new_header.append(line)
-
-                # Write new header
-                for line in new_header:
-                    f_out.write(line)
-                
-                # Copy the rest of the file
-                shutil.copyfileobj(f_in, f_out)
+                header = b"".join(header_lines)
+                new_header = header.replace(b"property uint ", b"property int  ")
+                if new_header == header:
+                    return
+
+                # Same length, so only the header bytes are rewritten
+                f.seek(0)
+                f.write(new_header)
             
-            # Replace original file
-            os.replace(temp_path, ply_path)
             print(f"Sanitized PLY file: {ply_path}")
             
         except Exception as e:
             print(f"Error sanitizing PLY: {e}")
-            # Try cleanup
-            if temp_path.exists():
-                try: os.remove(temp_path)
-                except: pass
+
+
+def _resolve_sharp_cmd() -> str:
+    """Path of the `sharp` executable (PATH first, then next to the interpreter)."""
+    sharp_cmd = shutil.which("sharp")
+    if not sharp_cmd:
+        bin_dir = os.path.dirname(sys.executable)
+        if os.name == 'nt':
+            sharp_cmd = os.path.join(bin_dir, "Scripts", "sharp.exe")
+            if not os.path.exists(sharp_cmd):
+                sharp_cmd = os.path.join(bin_dir, "sharp.exe")
+        else:
+            sharp_cmd = os.path.join(bin_dir, "sharp")
+
+    if not sharp_cmd or not os.path.exists(sharp_cmd):
+        sharp_cmd = "sharp"  # fallback
+    return sharp_cmd
 
 
 # Global service instance
 _service: Optional[MLSharpService] = None
+_service_lock = threading.Lock()
+
+# Startup progress of the global service, reported by /ready
+_readiness = {"status": "starting", "error": None, "seconds": None}
 
 
 def get_service() -> MLSharpService:
     """Get or create the global MLSharpService instance."""
     global _service
     if _service is None:
-        _service = MLSharpService()
+        with _service_lock:
+            if _service is None:
+                _service = MLSharpService()
     return _service
+
+
+def initialise_service(warm_up: bool = True) -> MLSharpService:
+    """
+    Create the global service (model download and load) and optionally run
+    a warm-up prediction, recording progress for `readiness()`. Meant to
+    run in the background at startup.
+    """
+    started = time.monotonic()
+    try:
+        _readiness["status"] = "loading"
+        service = get_service()
+        # A CLI-mode prediction spawns a fresh process, so there is nothing to warm
+        if warm_up and service.engine is not None:
+            _readiness["status"] = "warming"
+            service.warm_up()
+    except Exception as e:
+        _readiness.update(status="failed", error=str(e))
+        raise
+    _readiness.update(status="ready", seconds=round(time.monotonic() - started, 3))
+    return service
+
+
+def readiness() -> dict:
+    """Startup state of the global service: starting/loading/warming/ready/failed."""
+    return dict(_readiness)
@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+
+@dataclass
+class OssImageRecord:
+    """Content hash and dimensions of one version (ETag) of an OSS object."""
+    image_hash: str
+    width: Optional[int]
+    height: Optional[int]
+
+
+class OssHashIndex:
+    """
+    Persistent map from OSS object key + ETag to the image's SHA-256.
+
+    An object's ETag changes whenever its content does, so a repeat URL can
+    be resolved to its cached PLY from a single HEAD request, without
+    transferring the image again.
+    """
+
+    def __init__(self, db_path: Path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            " key TEXT NOT NULL,"
+            " etag TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " width INTEGER,"
+            " height INTEGER,"
+            " updated REAL NOT NULL,"
+            " PRIMARY KEY (key, etag))"
+        )
+
+    def get(self, key: str, etag: str) -> Optional[OssImageRecord]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT hash, width, height FROM objects WHERE key = ? AND etag = ?", (key, etag)
+            ).fetchone()
+        return OssImageRecord(*row) if row else None
+
+    def put(self, key: str, etag: str, record: OssImageRecord):
+        """Record an object version; older versions of the same key are dropped."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM objects WHERE key = ? AND etag != ?", (key, etag))
+            self._db.execute(
+                "INSERT OR REPLACE INTO objects (key, etag, hash, width, height, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, etag, record.image_hash, record.width, record.height, time.time()),
+            )
+            self._db.execute("COMMIT")
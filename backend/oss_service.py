@@ -1,6 +1,12 @@
 import os,sys
+import hashlib
 import math
+import threading
 import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from urllib.parse import urlparse
 from typing import Optional
 from oss2 import Auth, Bucket
@@ -17,19 +23,46 @@ import logging
 
 logger = logging.getLogger("media_generation")
 
+# 并行分段下载参数：超过阈值的对象按分段大小拆分为多个Range请求
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_PART_SIZE = 8 * 1024 * 1024
+RANGED_DOWNLOAD_THRESHOLD = 16 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 上传前等待文件写入完成的最长时间（秒）
+READY_TIMEOUT = 10
+
+
+@dataclass
+class ObjectInfo:
+    """OSS对象元数据：对象键、ETag与字节数"""
+    key: str
+    etag: str
+    size: int
+
+
+@dataclass
+class DownloadResult:
+    """下载结果：本地路径、内容SHA-256与字节数"""
+    path: str
+    sha256: str
+    size: int
+
 
 class OSSService:
     """OSS操作服务（修复文件大小为0问题，含完整校验机制）"""
 
     def __init__(self, oss_config: dict):
         self.config = oss_config
-        # 初始化OSS认证与Bucket连接
+        # 初始化OSS认证与Bucket连接（共享连接池的Session，复用TCP/TLS连接）
         self.auth = Auth(self.config["access_key_id"], self.config["access_key_secret"])
+        self.session = oss2.Session(pool_size=DOWNLOAD_WORKERS * 4)
         self.bucket = Bucket(
             self.auth,
             f"https://{self.config['endpoint']}",
             self.config["bucket_name"],
             connect_timeout=120,  # 建立TCP连接的最大等待时间
+            session=self.session,
         )
         # 从配置获取视频/图片存储根目录
         self.video_folder = self.config["video_folder"]
@@ -92,6 +125,147 @@ class OSSService:
             )
             return None
 
+    def head(self, oss_url: str) -> Optional[ObjectInfo]:
+        """获取OSS对象的键、ETag与大小（一次HEAD请求，不传输内容）"""
+        object_path = urlparse(oss_url).path.lstrip("/")
+        try:
+            head_info = self.bucket.head_object(object_path)
+        except Exception as e:
+            logger.error(f"OSS对象HEAD失败 | OSS URL：{oss_url} | 错误信息：{str(e)}")
+            return None
+        return ObjectInfo(object_path, head_info.etag, head_info.content_length)
+
+    def download_with_hash(
+        self, oss_url: str, local_path: str, total_size: Optional[int] = None
+    ) -> Optional[DownloadResult]:
+        """
+        从OSS下载文件到指定路径，写入本地的同时计算SHA-256（无需再次读取文件）
+        大文件使用并行分段（Range）下载；不输出逐块进度日志
+        已通过head()获取大小时传入total_size，可省去一次HEAD请求
+        """
+        try:
+            object_path = urlparse(oss_url).path.lstrip("/")
+            if total_size is None:
+                total_size = self.bucket.head_object(object_path).content_length
+
+            # 先写入唯一的临时文件，完成后原子替换，避免并发下载同一对象时互相覆盖
+            temp_path = f"{local_path}.{uuid.uuid4().hex}.part"
+            try:
+                if total_size >= RANGED_DOWNLOAD_THRESHOLD:
+                    digest = self._download_ranged(object_path, temp_path, total_size)
+                else:
+                    digest = self._download_stream(object_path, temp_path)
+                os.replace(temp_path, local_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            size = os.path.getsize(local_path)
+            if size == 0:
+                logger.warning(f"OSS下载文件无效 | 本地路径：{local_path}（文件为空）")
+                os.remove(local_path)
+                return None
+            logger.info(f"OSS文件下载成功 | OSS URL：{oss_url} -> 本地路径：{local_path}（{size}字节）")
+            return DownloadResult(local_path, digest, size)
+
+        except Exception as e:
+            logger.error(
+                f"OSS文件下载失败 | OSS URL：{oss_url} | 错误信息：{str(e)}",
+                exc_info=True,
+            )
+            return None
+
+    def _download_stream(self, object_path: str, local_path: str) -> str:
+        """单个GET流式下载，边写边计算哈希"""
+        sha = hashlib.sha256()
+        result = self.bucket.get_object(object_path)
+        with open(local_path, "wb") as f:
+            for chunk in iter(lambda: result.read(DOWNLOAD_CHUNK_SIZE), b""):
+                sha.update(chunk)
+                f.write(chunk)
+        return sha.hexdigest()
+
+    def _download_ranged(self, object_path: str, local_path: str, total_size: int) -> str:
+        """
+        并行分段下载：多个线程各自请求一个字节区间，
+        主线程按顺序写入文件并计算哈希；同时在途的分段数有上限，内存占用可控
+        """
+        ranges = [
+            (start, min(start + DOWNLOAD_PART_SIZE, total_size) - 1)
+            for start in range(0, total_size, DOWNLOAD_PART_SIZE)
+        ]
+
+        def fetch(byte_range):
+            return self.bucket.get_object(object_path, byte_range=byte_range).read()
+
+        sha = hashlib.sha256()
+        max_in_flight = DOWNLOAD_WORKERS * 2
+        with open(local_path, "wb") as f, ThreadPoolExecutor(DOWNLOAD_WORKERS) as pool:
+            pending = deque()
+            next_index = 0
+            while pending or next_index < len(ranges):
+                while next_index < len(ranges) and len(pending) < max_in_flight:
+                    pending.append(pool.submit(fetch, ranges[next_index]))
+                    next_index += 1
+                data = pending.popleft().result()
+                sha.update(data)
+                f.write(data)
+        if os.path.getsize(local_path) != total_size:
+            raise IOError(f"分段下载大小不符：{os.path.getsize(local_path)} != {total_size}")
+        return sha.hexdigest()
+
+    @staticmethod
+    def _wait_until_ready(local_path: str) -> int:
+        """
+        等待文件写入完成（大小大于0），返回文件大小；超时仍为空时返回0
+        文件已就绪时立即返回，否则按指数退避短暂轮询，不再固定等待
+        """
+        deadline = time.monotonic() + READY_TIMEOUT
+        delay = 0.05
+        while True:
+            local_file_size = os.path.getsize(local_path)
+            if local_file_size > 0:
+                return local_file_size
+            if time.monotonic() + delay > deadline:
+                logger.error(f"文件始终为空 | 路径：{local_path}（已等待{READY_TIMEOUT}秒）")
+                return 0
+            logger.warning(f"文件未就绪（大小为0） | 路径：{local_path} | {delay:.2f}秒后重试")
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    def put_object(self, local_path: str, object_path: str) -> bool:
+        """按指定对象键上传本地文件（不等待、不打印逐块进度），供结果缓存发布使用"""
+        try:
+            self.bucket.put_object_from_file(object_path, local_path)
+            logger.info(f"OSS对象上传成功 | 本地路径：{local_path} -> OSS路径：{object_path}")
+            return True
+        except Exception as e:
+            logger.error(f"OSS对象上传失败 | OSS路径：{object_path} | 错误信息：{str(e)}")
+            return False
+
+    def get_object(self, object_path: str, local_path: str) -> bool:
+        """
+        按对象键下载到指定路径；对象不存在时返回False
+        先写入唯一的临时文件再原子替换，读取方不会看到写了一半的文件
+        """
+        temp_path = f"{local_path}.{uuid.uuid4().hex}.part"
+        try:
+            self.bucket.get_object_to_file(object_path, temp_path)
+            os.replace(temp_path, local_path)
+            return True
+        except oss2.exceptions.NoSuchKey:
+            return False
+        except Exception as e:
+            logger.error(f"OSS对象下载失败 | OSS路径：{object_path} | 错误信息：{str(e)}")
+            return False
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def sign_object_url(self, object_path: str, expire_seconds: int = 3600) -> str:
+        """生成对象的临时访问链接（本地签名，不发起网络请求）"""
+        return self.bucket.sign_url("GET", object_path, expire_seconds)
+
     def upload_file(
         self, local_path: str, oss_folder: str, is_video: bool = False
     ) -> Optional[str]:
@@ -123,29 +297,9 @@ class OSSService:
                 return None
 
             # 2. 等待文件就绪（解决生成工具未释放句柄问题）
-            max_retry = 5  # 最大重试次数
-            retry_interval = 10  # 重试间隔（秒）
-            local_file_size = 0
-            # 先睡眠5秒
-            time.sleep(5)
-
-            for retry in range(max_retry):
-                local_file_size = os.path.getsize(local_path)
-                logger.info(f"文件大小：{local_file_size}")
-                if local_file_size > 0:
-                    break  # 文件大小正常，退出等待
-                # 最后一次重试仍为0，直接报错
-                if retry == max_retry - 1:
-                    logger.error(
-                        f"文件始终为空 | 路径：{local_path}（已重试{max_retry}次）"
-                    )
-                    return None
-                # 继续等待并重试
-                logger.warning(
-                    f"文件未就绪（大小为0） | 路径：{local_path} | "
-                    f"重试次数：{retry+1}/{max_retry} | {retry_interval}秒后重试"
-                )
-                time.sleep(retry_interval)
+            local_file_size = self._wait_until_ready(local_path)
+            if not local_file_size:
+                return None
 
             # 3. 构建OSS路径信息
             local_filename = os.path.basename(local_path)
@@ -243,27 +397,10 @@ class OSSService:
                 )
                 return None
 
-            # 2. 等待文件就绪（原有逻辑不变）
-            max_retry = 5
-            retry_interval = 10
-            local_file_size = 0
-            time.sleep(5)
-
-            for retry in range(max_retry):
-                local_file_size = os.path.getsize(local_path)
-                logger.info(f"文件大小：{local_file_size}")
-                if local_file_size > 0:
-                    break
-                if retry == max_retry - 1:
-                    logger.error(
-                        f"文件始终为空 | 路径：{local_path}（已重试{max_retry}次）"
-                    )
-                    return None
-                logger.warning(
-                    f"文件未就绪（大小为0） | 路径：{local_path} | "
-                    f"重试次数：{retry+1}/{max_retry} | {retry_interval}秒后重试"
-                )
-                time.sleep(retry_interval)
+            # 2. 等待文件就绪
+            local_file_size = self._wait_until_ready(local_path)
+            if not local_file_size:
+                return None
 
             # 3. 构建OSS路径信息（原有逻辑不变）
             local_filename = os.path.basename(local_path)
@@ -346,3 +483,19 @@ class OSSService:
                 exc_info=True,
             )
             return None
+
+
+
+# 进程级共享的OSS服务实例（复用Auth、Bucket与连接池）
+_oss_service: Optional[OSSService] = None
+_oss_service_lock = threading.Lock()
+
+
+def get_oss_service() -> OSSService:
+    """Get or create the process-wide OSSService instance."""
+    global _oss_service
+    if _oss_service is None:
+        with _oss_service_lock:
+            if _oss_service is None:
+                _oss_service = OSSService(OSS_CONFIG)
+    return _oss_service
@@ -0,0 +1,195 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional, Set, Tuple
+from http_cache import precompress
+from metrics import STAGE_SECONDS
+from ply_cache import PlyCache
+from ply_meta import write_meta
+from ply_utils import reorder_by_importance
+from splat_codec import encode_csplat
+from splat_decimate import decimate_ply, vertex_count
+from splat_preview import DEFAULT_SIZE, PREVIEW_FORMAT, write_preview
+
+# Served representations of a cached PLY: ?format= value -> file suffix
+FORMATS = {
+    "ply": ".ply",
+    "csplat": ".csplat",
+}
+# JSON summary of a cached PLY (see ply_meta.py)
+META_SUFFIX = ".meta.json"
+# Preview image of a cached PLY (see splat_preview.py): suffix, media type
+THUMBNAIL_SUFFIX, THUMBNAIL_MEDIA_TYPE = PREVIEW_FORMAT[0], PREVIEW_FORMAT[2]
+
+
+# Striped locks, so concurrent requests for one variant build it only once
+_variant_locks = [threading.Lock() for _ in range(64)]
+
+
+def _variant_lock(path: Path) -> threading.Lock:
+    return _variant_locks[hash(path.name) % len(_variant_locks)]
+
+
+def prepare_ply(ply_path: Path):
+    """
+    Finalise a generated PLY before it is published to the cache:
+    gaussians are ordered by importance so every served encoding can be
+    rendered progressively from a prefix.
+    """
+    try:
+        reorder_by_importance(ply_path)
+    except Exception as e:
+        print(f"Failed to reorder PLY {ply_path.name} by importance: {e}")
+
+
+def build_artifacts(cache: PlyCache, image_hash: str):
+    """
+    Derive the served variants of a freshly cached PLY, plus their
+    precompressed gzip/zstd encodings and the metadata sidecar.
+    Runs once at cache time (in the background, see ArtifactBuilder);
+    failures only mean the variant is built lazily on first request instead.
+    """
+    try:
+        ensure_format(cache, image_hash, "csplat")
+        precompress(cache.path_for(image_hash))
+        ensure_meta(cache, image_hash)
+        cache.add(image_hash)
+    except Exception as e:
+        print(f"Failed to build artifacts for image hash {image_hash[:12]}...: {e}")
+
+
+def ensure_format(cache: PlyCache, image_hash: str, fmt: str) -> Path:
+    """Return the path of a cached PLY in the requested format, converting it if missing."""
+    path = cache.path_for(image_hash, FORMATS[fmt])
+    if fmt == "csplat" and not path.exists():
+        with _variant_lock(path):
+            if not path.exists():
+                encode_csplat(cache.path_for(image_hash), path)
+                precompress(path)
+                print(f"Encoded compact splat for image hash {image_hash[:12]}... ({path.stat().st_size} bytes)")
+                cache.add(image_hash)
+    return path
+
+
+def ensure_meta(cache: PlyCache, image_hash: str) -> Path:
+    """Return the metadata sidecar of a cached PLY, computing it if missing."""
+    path = cache.path_for(image_hash, META_SUFFIX)
+    if not path.exists():
+        with _variant_lock(path):
+            if not path.exists():
+                write_meta(cache.path_for(image_hash), path)
+                cache.add(image_hash)
+    return path
+
+
+def ensure_decimated(cache: PlyCache, image_hash: str, fmt: str, max_splats: int) -> Tuple[Path, Optional[int]]:
+    """
+    Return a cached PLY reduced to at most `max_splats` gaussians, in the
+    requested format, building it on first request (see splat_decimate.py).
+    Variants are stored next to the full PLY as `<hash>.s<N>.<format>`, so
+    they expire and are evicted with it.
+
+    Returns:
+        (path, level), where level is None when the full scene already fits
+    """
+    source = cache.path_for(image_hash)
+    if vertex_count(source) <= max_splats:
+        return ensure_format(cache, image_hash, fmt), None
+
+    ply_path = cache.path_for(image_hash, f".s{max_splats}.ply")
+    path = cache.path_for(image_hash, f".s{max_splats}{FORMATS[fmt]}")
+    with _variant_lock(path):
+        if not ply_path.exists():
+            count = decimate_ply(source, ply_path, max_splats)
+            precompress(ply_path)
+            print(f"Decimated PLY for image hash {image_hash[:12]}... to {count} gaussians")
+        if fmt == "csplat" and not path.exists():
+            encode_csplat(ply_path, path)
+            precompress(path)
+        cache.add(image_hash)
+    return path, max_splats
+
+
+def ensure_thumbnail(cache: PlyCache, image_hash: str, size: int = DEFAULT_SIZE) -> Path:
+    """Return the preview image of a cached PLY, rendering it if missing."""
+    path = cache.path_for(image_hash, THUMBNAIL_SUFFIX)
+    with _variant_lock(path):
+        if not path.exists():
+            with STAGE_SECONDS.time(stage="preview"):
+                write_preview(cache.path_for(image_hash), path, size)
+            cache.add(image_hash)
+    return path
+
+
+class ArtifactBuilder:
+    """
+    Runs `build_artifacts` for freshly cached PLYs in background threads,
+    so compression and encoding never hold up the generation workers (and
+    the device they feed). Until a build finishes, the endpoints build
+    whatever variant is requested on demand.
+    """
+
+    def __init__(self, cache: PlyCache, workers: int = 1):
+        self.cache = cache
+        self._builds = ThreadPoolExecutor(workers, thread_name_prefix="artifacts")
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def build_async(self, image_hash: str):
+        """Queue the artifact build of a cached PLY; failures are logged, never raised."""
+        with self._lock:
+            if image_hash in self._pending:
+                return
+            self._pending.add(image_hash)
+        self._builds.submit(self._build, image_hash)
+
+    def close(self):
+        """Wait for queued builds to finish."""
+        self._builds.shutdown(wait=True)
+
+    def _build(self, image_hash: str):
+        try:
+            build_artifacts(self.cache, image_hash)
+        finally:
+            with self._lock:
+                self._pending.discard(image_hash)
+
+
+class PreviewRenderer:
+    """
+    Renders thumbnails of freshly cached PLYs in a background thread, so a
+    generation is reported done without waiting for its preview. Requests
+    for a preview that is not rendered yet build it on demand instead.
+    """
+
+    def __init__(self, cache: PlyCache, size: int = DEFAULT_SIZE, workers: int = 1):
+        self.cache = cache
+        self.size = size
+        self._renders = ThreadPoolExecutor(workers, thread_name_prefix="preview")
+        self._pending: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def render_async(self, image_hash: str):
+        """Queue a preview render; failures are logged, never raised."""
+        with self._lock:
+            if image_hash in self._pending:
+                return
+            self._pending.add(image_hash)
+        self._renders.submit(self._render_logged, image_hash)
+
+    def ensure(self, image_hash: str) -> Path:
+        """Return the preview of a cached PLY, rendering it now if missing (blocking)."""
+        return ensure_thumbnail(self.cache, image_hash, self.size)
+
+    def close(self):
+        """Drop queued renders and wait for the running one to finish."""
+        self._renders.shutdown(wait=True, cancel_futures=True)
+
+    def _render_logged(self, image_hash: str):
+        try:
+            self.ensure(image_hash)
+        except Exception as e:
+            print(f"Failed to render preview for image hash {image_hash[:12]}...: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(image_hash)
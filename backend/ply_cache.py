@@ -0,0 +1,248 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple
+
+# Cache keys are lowercase hex SHA-256 digests
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_cache_key(value: str) -> bool:
+    """Check that a string is a well-formed cache key (guards path construction)."""
+    return bool(_HASH_RE.match(value))
+
+
+@dataclass
+class CacheEntry:
+    """Index record for one cached image hash."""
+    image_hash: str
+    path: Path
+    size: int
+    created: float
+    last_access: float
+    hits: int
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created
+
+
+class PlyCache:
+    """
+    Content-addressed PLY cache with a SQLite index.
+
+    Files are sharded by hash prefix (`<root>/ab/abcd....ply`) and every
+    artifact derived from the same image shares the hash as its filename
+    prefix, so an entry's bytes are the sum of `<hash>*` in its shard.
+    The index keeps size, creation time, last access and hit count, so
+    cache hits never stat the disk (a miss checks for an unindexed file to
+    adopt), and expiry (TTL) plus size-bounded LRU eviction run in a
+    periodic background sweep instead of at startup. Files are deleted
+    outside the index lock, so lookups never wait on a large sweep.
+    """
+
+    def __init__(self, root: Path, ttl_seconds: float, max_bytes: int = 0):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        index_path = self.root / "index.sqlite3"
+        self._needs_rebuild = not index_path.exists()
+        self._lock = threading.Lock()
+        # Hashes dropped from the index whose files are still being deleted
+        self._deleting = set()
+        self._db = sqlite3.connect(index_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " hash TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_access REAL NOT NULL,"
+            " hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access)")
+
+    def path_for(self, image_hash: str, suffix: str = ".ply") -> Path:
+        """Sharded location of an artifact for this image hash."""
+        return self.root / image_hash[:2] / f"{image_hash}{suffix}"
+
+    def lookup(self, image_hash: str) -> Optional[CacheEntry]:
+        """
+        Return the live entry for a hash and record the access, or None on a miss.
+        Expired entries are removed; files missing from the index (legacy flat
+        layout or a lost index) are adopted on first lookup.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, created, hits FROM entries WHERE hash = ?", (image_hash,)
+            ).fetchone()
+            if row is None:
+                row = self._adopt_locked(image_hash)
+                if row is None:
+                    return None
+            size, created, hits = row
+            expired = now - created >= self.ttl_seconds
+            if expired:
+                self._forget_locked(image_hash)
+            else:
+                self._db.execute(
+                    "UPDATE entries SET last_access = ?, hits = hits + 1 WHERE hash = ?",
+                    (now, image_hash),
+                )
+        if expired:
+            self._delete_files(image_hash)
+            print(f"Cache expired for image hash {image_hash[:12]}..., regenerating")
+            return None
+        return CacheEntry(image_hash, self.path_for(image_hash), size, created, now, hits + 1)
+
+    def contains(self, image_hash: str) -> bool:
+        """Check for a live indexed entry without recording an access."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT created FROM entries WHERE hash = ?", (image_hash,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] < self.ttl_seconds
+
+    def add(self, image_hash: str):
+        """Register (or re-measure) the artifacts for a hash once they are in place."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO entries (hash, size, created, last_access, hits) VALUES (?, ?, ?, ?, 0)"
+                " ON CONFLICT(hash) DO UPDATE SET size = excluded.size, last_access = excluded.last_access",
+                (image_hash, self._entry_bytes(image_hash), now, now),
+            )
+
+    def remove(self, image_hash: str):
+        """Delete every artifact for a hash and drop it from the index."""
+        with self._lock:
+            self._forget_locked(image_hash)
+        self._delete_files(image_hash)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def sweep(self) -> Tuple[int, int]:
+        """
+        Remove expired entries, then evict least recently used entries until
+        the cache fits in `max_bytes` (0 means unbounded). Victims leave the
+        index under the lock; their files are deleted after it is released.
+
+        Returns:
+            (expired, evicted) entry counts
+        """
+        if self._needs_rebuild:
+            self._rebuild()
+
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [h for (h,) in self._db.execute(
+                "SELECT hash FROM entries WHERE created < ?", (cutoff,)
+            ).fetchall()]
+            for image_hash in expired:
+                self._forget_locked(image_hash)
+
+            evicted = []
+            if self.max_bytes:
+                total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    for image_hash, size in self._db.execute(
+                        "SELECT hash, size FROM entries ORDER BY last_access"
+                    ).fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        self._forget_locked(image_hash)
+                        total -= size
+                        evicted.append(image_hash)
+
+        for image_hash in expired + evicted:
+            self._delete_files(image_hash)
+        return len(expired), len(evicted)
+
+    async def run_sweeper(self, interval: float):
+        """Sweep periodically in a worker thread until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                expired, evicted = await loop.run_in_executor(None, self.sweep)
+                if expired or evicted:
+                    print(f"PLY cache sweep: {expired} expired, {evicted} evicted")
+            except Exception as e:
+                print(f"PLY cache sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+    def _entry_bytes(self, image_hash: str) -> int:
+        shard = self.path_for(image_hash).parent
+        total = 0
+        for p in shard.glob(f"{image_hash}*"):
+            if p.suffix != ".part":
+                try:
+                    total += p.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def _adopt_locked(self, image_hash: str):
+        """Index a PLY that exists on disk but not in the index."""
+        if image_hash in self._deleting:
+            return None
+        path = self.path_for(image_hash)
+        try:
+            created = path.stat().st_mtime
+        except FileNotFoundError:
+            legacy = self.root / f"{image_hash}.ply"
+            try:
+                created = legacy.stat().st_mtime
+            except FileNotFoundError:
+                return None
+            path.parent.mkdir(exist_ok=True)
+            os.replace(legacy, path)
+        size = self._entry_bytes(image_hash)
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (hash, size, created, last_access, hits) VALUES (?, ?, ?, ?, 0)",
+            (image_hash, size, created, created),
+        )
+        return size, created, 0
+
+    def _forget_locked(self, image_hash: str):
+        """Drop a hash from the index; its files must then go through `_delete_files`."""
+        self._db.execute("DELETE FROM entries WHERE hash = ?", (image_hash,))
+        self._deleting.add(image_hash)
+
+    def _delete_files(self, image_hash: str):
+        """Delete every artifact of a forgotten hash (called without the lock)."""
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM entries WHERE hash = ?", (image_hash,)).fetchone():
+                # Regenerated and re-added since it was dropped: keep the new files
+                self._deleting.discard(image_hash)
+                return
+        shard = self.path_for(image_hash).parent
+        try:
+            for p in shard.glob(f"{image_hash}*"):
+                if p.suffix != ".part":
+                    p.unlink(missing_ok=True)
+        finally:
+            with self._lock:
+                self._deleting.discard(image_hash)
+
+    def _rebuild(self):
+        """Index PLYs already on disk (run once, from the sweeper, when the index is new)."""
+        count = 0
+        for path in list(self.root.glob("*.ply")) + list(self.root.glob("??/*.ply")):
+            if not is_cache_key(path.stem):
+                continue
+            with self._lock:
+                if self._adopt_locked(path.stem) is not None:
+                    count += 1
+        self._needs_rebuild = False
+        if count:
+            print(f"Indexed {count} existing PLY cache file(s)")
@@ -0,0 +1,72 @@
+import json
+import os
+import threading
+from pathlib import Path
+import numpy as np
+from ply_utils import gaussian_log_scales, gaussian_positions, load_vertices
+
+# Bump when fields change, so clients can tell sidecar layouts apart
+META_VERSION = 1
+
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+def _percentiles(values: np.ndarray) -> dict:
+    if not len(values):
+        return {}
+    return {f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def compute_meta(ply_path: Path) -> dict:
+    """
+    Summarise a gaussian PLY in one pass over the memory-mapped vertices:
+    layout, bounds (full and 1st-99th percentile), robust (median)
+    centroid, and percentiles of the largest linear scale and of opacity.
+    """
+    header, vertices = load_vertices(ply_path)
+    names = set(vertices.dtype.names)
+    meta = {
+        "version": META_VERSION,
+        "byte_size": ply_path.stat().st_size,
+        "header_size": header.header_size,
+        "vertex_count": len(vertices),
+        "elements": [
+            {
+                "name": element.name,
+                "count": element.count,
+                "properties": [{"name": n, "type": t} for n, t in element.properties],
+            }
+            for element in header.elements
+        ],
+    }
+
+    if {"x", "y", "z"} <= names and len(vertices):
+        positions = gaussian_positions(vertices)
+        low, high = np.percentile(positions, [1, 99], axis=0)
+        meta["bounds"] = {"min": positions.min(axis=0).tolist(), "max": positions.max(axis=0).tolist()}
+        meta["robust_bounds"] = {"min": low.tolist(), "max": high.tolist()}
+        meta["centroid"] = np.median(positions, axis=0).tolist()
+    if {"scale_0", "scale_1", "scale_2"} <= names:
+        meta["scale"] = _percentiles(np.exp(gaussian_log_scales(vertices).max(axis=1)))
+    if "opacity" in names:
+        meta["opacity"] = _percentiles(1.0 / (1.0 + np.exp(-vertices["opacity"].astype(np.float32))))
+
+    # ml-sharp stores the source image size next to the gaussians
+    try:
+        element = header.element("image_size")
+        with open(ply_path, "rb") as f:
+            f.seek(header.element_offset("image_size"))
+            size = np.frombuffer(f.read(element.count * element.dtype.itemsize), dtype=element.dtype)
+        meta["image_size"] = [int(v[0]) for v in size]
+    except KeyError:
+        pass
+    return meta
+
+
+def write_meta(ply_path: Path, output_path: Path) -> Path:
+    """Write the metadata sidecar of a PLY as JSON, atomically."""
+    temp_path = output_path.with_name(f"{output_path.name}.{os.getpid()}-{threading.get_ident()}.part")
+    with open(temp_path, "w") as f:
+        json.dump(compute_meta(ply_path), f, separators=(",", ":"))
+    os.replace(temp_path, output_path)
+    return output_path
@@ -0,0 +1,177 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Tuple
+import numpy as np
+
+# PLY scalar types -> little-endian NumPy dtypes
+PLY_DTYPES = {
+    "char": "i1", "int8": "i1",
+    "uchar": "u1", "uint8": "u1",
+    "short": "<i2", "int16": "<i2",
+    "ushort": "<u2", "uint16": "<u2",
+    "int": "<i4", "int32": "<i4",
+    "uint": "<u4", "uint32": "<u4",
+    "float": "<f4", "float32": "<f4",
+    "double": "<f8", "float64": "<f8",
+}
+
+# Zeroth-order spherical harmonic constant (f_dc -> RGB)
+SH_C0 = 0.28209479177387814
+
+
+@dataclass
+class PlyElement:
+    name: str
+    count: int
+    properties: List[Tuple[str, str]]
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype([(name, PLY_DTYPES[ply_type]) for name, ply_type in self.properties])
+
+
+@dataclass
+class PlyHeader:
+    format: str
+    elements: List[PlyElement]
+    header_size: int
+
+    def element(self, name: str) -> PlyElement:
+        for element in self.elements:
+            if element.name == name:
+                return element
+        raise KeyError(f"PLY has no '{name}' element")
+
+    def element_offset(self, name: str) -> int:
+        """Byte offset of an element's data from the start of the file."""
+        offset = self.header_size
+        for element in self.elements:
+            if element.name == name:
+                return offset
+            offset += element.count * element.dtype.itemsize
+        raise KeyError(f"PLY has no '{name}' element")
+
+
+def read_ply_header(ply_path: Path) -> PlyHeader:
+    """Parse the ASCII header of a binary little-endian PLY file."""
+    fmt = None
+    elements: List[PlyElement] = []
+    with open(ply_path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError(f"Not a PLY file: {ply_path}")
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"PLY header has no end_header: {ply_path}")
+            parts = line.decode("ascii", errors="replace").split()
+            if not parts:
+                continue
+            if parts[0] == "end_header":
+                break
+            if parts[0] == "format":
+                fmt = parts[1]
+            elif parts[0] == "element":
+                elements.append(PlyElement(parts[1], int(parts[2]), []))
+            elif parts[0] == "property":
+                if parts[1] == "list":
+                    raise ValueError("PLY list properties are not supported")
+                elements[-1].properties.append((parts[2], parts[1]))
+        header_size = f.tell()
+
+    if fmt != "binary_little_endian":
+        raise ValueError(f"Unsupported PLY format: {fmt}")
+    return PlyHeader(fmt, elements, header_size)
+
+
+def load_vertices(ply_path: Path) -> Tuple[PlyHeader, np.ndarray]:
+    """
+    Memory-map the vertex element of a binary PLY as a structured array.
+    Nothing is read until fields are accessed.
+    """
+    header = read_ply_header(ply_path)
+    vertex = header.element("vertex")
+    vertices = np.memmap(
+        ply_path,
+        dtype=vertex.dtype,
+        mode="r",
+        offset=header.element_offset("vertex"),
+        shape=(vertex.count,),
+    )
+    return header, vertices
+
+
+def gaussian_colors(vertices: np.ndarray) -> np.ndarray:
+    """RGBA uint8 colours from the DC spherical harmonics and logit opacity."""
+    rgba = np.empty((len(vertices), 4), dtype=np.float32)
+    for i in range(3):
+        rgba[:, i] = 0.5 + SH_C0 * vertices[f"f_dc_{i}"]
+    rgba[:, 3] = 1.0 / (1.0 + np.exp(-vertices["opacity"].astype(np.float32)))
+    return np.clip(rgba * 255.0, 0, 255).astype(np.uint8)
+
+
+def gaussian_positions(vertices: np.ndarray) -> np.ndarray:
+    return np.stack([vertices["x"], vertices["y"], vertices["z"]], axis=1).astype(np.float32)
+
+
+def gaussian_log_scales(vertices: np.ndarray) -> np.ndarray:
+    return np.stack([vertices[f"scale_{i}"] for i in range(3)], axis=1).astype(np.float32)
+
+
+def gaussian_rotations(vertices: np.ndarray) -> np.ndarray:
+    """Unit quaternions (w, x, y, z) with w >= 0."""
+    rot = np.stack([vertices[f"rot_{i}"] for i in range(4)], axis=1).astype(np.float32)
+    norm = np.linalg.norm(rot, axis=1, keepdims=True)
+    rot /= np.where(norm > 0, norm, 1.0)
+    rot *= np.where(rot[:, :1] < 0, -1.0, 1.0)
+    return rot
+
+
+def quaternion_matrices(rotations: np.ndarray) -> np.ndarray:
+    """Rotation matrices from (w, x, y, z) quaternions."""
+    q = rotations / np.maximum(np.linalg.norm(rotations, axis=1, keepdims=True), 1e-12)
+    w, x, y, z = q.T
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], axis=1),
+        np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], axis=1),
+        np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=1),
+    ], axis=1)
+
+
+def gaussian_covariances(vertices: np.ndarray) -> np.ndarray:
+    """World-space 3x3 covariance of each gaussian, R S S^T R^T (float64)."""
+    rotations = np.stack([vertices[f"rot_{i}"] for i in range(4)], axis=1).astype(np.float64)
+    axes = quaternion_matrices(rotations) * np.exp(gaussian_log_scales(vertices).astype(np.float64))[:, None, :]
+    return np.einsum("nij,nkj->nik", axes, axes)
+
+
+def gaussian_log_importance(vertices: np.ndarray) -> np.ndarray:
+    """Log of each gaussian's visual importance, opacity x ellipsoid volume (overflow-free)."""
+    log_opacity = -np.logaddexp(0.0, -vertices["opacity"].astype(np.float32))
+    return log_opacity + gaussian_log_scales(vertices).sum(axis=1)
+
+
+def reorder_by_importance(ply_path: Path) -> bool:
+    """
+    Rewrite the vertex element of a PLY in place, most important gaussians first,
+    so that any prefix of the vertex data is a coarse level of detail.
+
+    Returns:
+        False if the PLY lacks the 3DGS properties needed to rank gaussians
+    """
+    header = read_ply_header(ply_path)
+    vertex = header.element("vertex")
+    names = {name for name, _ in vertex.properties}
+    if not {"opacity", "scale_0", "scale_1", "scale_2"} <= names:
+        return False
+    vertices = np.memmap(
+        ply_path,
+        dtype=vertex.dtype,
+        mode="r+",
+        offset=header.element_offset("vertex"),
+        shape=(vertex.count,),
+    )
+    order = np.argsort(-gaussian_log_importance(vertices), kind="stable")
+    vertices[:] = vertices[order]
+    vertices.flush()
+    del vertices
+    return True
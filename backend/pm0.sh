@@ -12,6 +12,7 @@ module.exports = {
     interpreter: '/root/miniconda3/envs/sharp/bin/python',
     env: {
       HF_ENDPOINT: 'https://hf-mirror.com',
+      // 未配置 config.INFERENCE_DEVICES 时在进程内推理,固定使用 GPU 0;启用多 GPU worker 池时去掉此项
       CUDA_VISIBLE_DEVICES: '0'
     },
     log_date_format: 'YYYY-MM-DD HH:mm:ss',
@@ -0,0 +1,86 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Set
+from oss_service import get_oss_service
+from ply_artifacts import FORMATS, ensure_format
+from ply_cache import PlyCache
+
+
+class RemotePlyCache:
+    """
+    Second cache tier in an OSS bucket shared by every backend node.
+
+    Objects mirror the local sharded layout under `prefix`
+    (`<prefix>/ab/abcd....ply`). A local miss is looked up here before
+    running inference, and freshly generated PLYs are published here in
+    background threads, so scaled-out nodes generate each image once.
+    Only the PLY and its compact splat are published; other variants are
+    cheap to derive locally. The PLY is uploaded last and is what `fetch`
+    looks for, so a node never sees a half-published entry.
+    """
+
+    PUBLISHED_FORMATS = ("csplat", "ply")
+
+    def __init__(self, cache: PlyCache, prefix: str, upload_workers: int = 2):
+        self.cache = cache
+        self.prefix = prefix.strip("/")
+        self._uploads = ThreadPoolExecutor(upload_workers, thread_name_prefix="oss-publish")
+        # Hashes known to be in the bucket (published or fetched by this process)
+        self._published: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def key_for(self, image_hash: str, suffix: str = ".ply") -> str:
+        return f"{self.prefix}/{image_hash[:2]}/{image_hash}{suffix}"
+
+    def fetch(self, image_hash: str) -> bool:
+        """
+        Download a PLY published by another node into the local cache (blocking).
+
+        Returns:
+            True if the PLY was found and is now cached locally
+        """
+        path = self.cache.path_for(image_hash)
+        path.parent.mkdir(exist_ok=True)
+        if not get_oss_service().get_object(self.key_for(image_hash), str(path)):
+            return False
+        self.cache.add(image_hash)
+        self._mark_published(image_hash)
+        return True
+
+    def publish(self, image_hash: str) -> bool:
+        """Upload the cached PLY and its compact splat (blocking)."""
+        oss = get_oss_service()
+        if not self.cache.path_for(image_hash).exists():
+            return False
+        for fmt in self.PUBLISHED_FORMATS:
+            path = ensure_format(self.cache, image_hash, fmt)
+            if not oss.put_object(str(path), self.key_for(image_hash, FORMATS[fmt])):
+                return False
+        self._mark_published(image_hash)
+        return True
+
+    def publish_async(self, image_hash: str):
+        """Publish in a background thread; failures are logged, never raised."""
+        self._uploads.submit(self._publish_logged, image_hash)
+
+    def signed_url(self, image_hash: str, fmt: str, expire_seconds: int) -> Optional[str]:
+        """A time-limited OSS URL for a published artifact, or None if it is not known to be there."""
+        with self._lock:
+            if image_hash not in self._published:
+                return None
+        return get_oss_service().sign_object_url(self.key_for(image_hash, FORMATS[fmt]), expire_seconds)
+
+    def close(self):
+        """Wait for pending uploads to finish."""
+        self._uploads.shutdown(wait=True)
+
+    def _mark_published(self, image_hash: str):
+        with self._lock:
+            self._published.add(image_hash)
+
+    def _publish_logged(self, image_hash: str):
+        try:
+            if self.publish(image_hash):
+                print(f"Published PLY for image hash {image_hash[:12]}... to OSS cache")
+        except Exception as e:
+            print(f"Failed to publish PLY for image hash {image_hash[:12]}... to OSS: {e}")
@@ -0,0 +1,111 @@
+import threading
+from pathlib import Path
+from typing import Optional
+import config
+
+
+class SharpEngine:
+    """
+    Resident ml-sharp predictor.
+
+    Loads the checkpoint once and keeps the model on the device, so each
+    prediction only pays for inference instead of interpreter startup,
+    the torch import and a full weight load like `sharp predict` does.
+    """
+
+    def __init__(self, model_path: Path, device: str):
+        self.model_path = model_path
+        self.device = device
+        self._predictor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_available() -> bool:
+        """Check whether ml-sharp exposes the Python API the engine needs."""
+        try:
+            from sharp.cli.predict import predict_image  # noqa: F401
+            from sharp.models import PredictorParams, create_predictor  # noqa: F401
+            from sharp.utils import io  # noqa: F401
+            from sharp.utils.gaussians import save_ply  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    @property
+    def loaded(self) -> bool:
+        return self._predictor is not None
+
+    def load(self):
+        """Load model weights onto the device (no-op if already loaded)."""
+        with self._lock:
+            self._load_locked()
+
+    def _load_locked(self):
+        if self._predictor is not None:
+            return
+
+        import torch
+        from sharp.models import PredictorParams, create_predictor
+
+        print(f"Loading ml-sharp model from {self.model_path} on {self.device}...")
+        state_dict = torch.load(self.model_path, weights_only=True, map_location="cpu")
+        predictor = create_predictor(PredictorParams())
+        predictor.load_state_dict(state_dict)
+        predictor.eval()
+        predictor.to(self.device)
+        self._predictor = predictor
+        print("ml-sharp model loaded")
+
+    def predict(self, image_path: Path, output_path: Path) -> Path:
+        """
+        Run a single prediction with the resident model.
+
+        Args:
+            image_path: Path to input image
+            output_path: Path where PLY file should be saved
+
+        Returns:
+            Path to generated PLY file
+        """
+        import torch
+        from sharp.cli.predict import predict_image
+        from sharp.utils import io
+        from sharp.utils.gaussians import save_ply
+
+        # The model is not safe to share between concurrent forward passes
+        with self._lock:
+            self._load_locked()
+            image, _, f_px = io.load_rgb(image_path)
+            height, width = image.shape[:2]
+            gaussians = predict_image(self._predictor, image, f_px, torch.device(self.device))
+            save_ply(gaussians, f_px, (height, width), output_path)
+
+        return output_path
+
+    def unload(self):
+        """Drop the resident model and release device memory."""
+        with self._lock:
+            if self._predictor is None:
+                return
+            self._predictor = None
+            if self.device.startswith("cuda"):
+                import torch
+                torch.cuda.empty_cache()
+
+
+def create_engine(device: str) -> Optional[SharpEngine]:
+    """
+    Create the resident engine according to `config.SHARP_ENGINE_MODE`.
+
+    "resident" requires the Python API, "cli" disables the engine and
+    "auto" (default) uses it when ml-sharp's Python API is importable.
+    """
+    mode = getattr(config, "SHARP_ENGINE_MODE", "auto")
+    if mode == "cli":
+        return None
+    if not SharpEngine.is_available():
+        if mode == "resident":
+            raise RuntimeError("SHARP_ENGINE_MODE is 'resident' but ml-sharp's Python API is not importable")
+        print("ml-sharp Python API not available, falling back to `sharp predict` CLI")
+        return None
+    return SharpEngine(config.MODEL_CHECKPOINT_PATH, device)
@@ -0,0 +1,94 @@
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from ply_utils import (
+    gaussian_colors,
+    gaussian_log_scales,
+    gaussian_positions,
+    gaussian_rotations,
+    load_vertices,
+)
+
+# Compact splat layout (little-endian), decoded by frontend/src/services/splatCodec.js
+#
+#   header (48 bytes):
+#     char[4]  magic "CSPL"
+#     uint32   version
+#     uint32   gaussian count
+#     float32  position min (x, y, z)
+#     float32  position max (x, y, z)
+#     float32  log-scale min
+#     float32  log-scale max
+#     uint32   reserved
+#
+#   record (16 bytes per gaussian):
+#     uint16[3] position, quantised within [min, max] per axis
+#     uint8[3]  log-scale, quantised within [min, max]
+#     uint8[4]  RGBA (colour from f_dc, alpha = sigmoid(opacity))
+#     uint8[3]  rotation x, y, z of the unit quaternion with w >= 0
+#
+# versus 56 bytes per gaussian (14 float32) in the model's PLY. Cached PLYs
+# are ordered by importance (ply_artifacts.prepare_ply), and records keep
+# that order, so any prefix of the stream is a renderable coarse scene.
+CSPLAT_MAGIC = b"CSPL"
+CSPLAT_VERSION = 1
+CSPLAT_HEADER = struct.Struct("<4sII3f3f2fI")
+CSPLAT_RECORD = np.dtype([
+    ("position", "<u2", (3,)),
+    ("scale", "u1", (3,)),
+    ("rgba", "u1", (4,)),
+    ("rotation", "u1", (3,)),
+])
+assert CSPLAT_HEADER.size == 48 and CSPLAT_RECORD.itemsize == 16
+
+
+def _quantize(values: np.ndarray, lo, hi, levels: int) -> np.ndarray:
+    span = np.where(hi > lo, hi - lo, 1.0)
+    q = np.rint((values - lo) / span * levels)
+    return np.clip(q, 0, levels)
+
+
+def encode_csplat(ply_path: Path, output_path: Path, order: Optional[np.ndarray] = None) -> Path:
+    """
+    Write the compact splat encoding of a gaussian PLY.
+
+    Args:
+        ply_path: Source PLY (binary little-endian, 3DGS vertex properties)
+        output_path: Destination file, written atomically
+        order: Optional permutation of gaussian indices to write in
+
+    Returns:
+        Path to the compact file
+    """
+    _, vertices = load_vertices(ply_path)
+    if order is not None:
+        vertices = vertices[order]
+
+    positions = gaussian_positions(vertices)
+    log_scales = gaussian_log_scales(vertices)
+    if len(vertices):
+        pos_min, pos_max = positions.min(axis=0), positions.max(axis=0)
+        scale_min, scale_max = float(log_scales.min()), float(log_scales.max())
+    else:
+        pos_min = pos_max = np.zeros(3, dtype=np.float32)
+        scale_min = scale_max = 0.0
+
+    records = np.empty(len(vertices), dtype=CSPLAT_RECORD)
+    records["position"] = _quantize(positions, pos_min, pos_max, 65535)
+    records["scale"] = _quantize(log_scales, scale_min, scale_max, 255)
+    records["rgba"] = gaussian_colors(vertices)
+    records["rotation"] = _quantize(gaussian_rotations(vertices)[:, 1:], -1.0, 1.0, 255)
+
+    header = CSPLAT_HEADER.pack(
+        CSPLAT_MAGIC, CSPLAT_VERSION, len(vertices),
+        *pos_min.tolist(), *pos_max.tolist(), scale_min, scale_max, 0,
+    )
+    temp_path = output_path.with_name(f"{output_path.name}.{os.getpid()}-{threading.get_ident()}.part")
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(records.tobytes())
+    os.replace(temp_path, output_path)
+    return output_path
@@ -0,0 +1,239 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from ply_utils import PlyHeader, gaussian_covariances, gaussian_log_scales, load_vertices, read_ply_header
+
+# Reduced-count variants of a cached PLY, for clients that cannot render
+# the full scene. Gaussians that cannot be seen are culled first; if the
+# scene is still too large, gaussians sharing a voxel are merged into one
+# (moment-matched: same weighted mean and covariance), with the voxel
+# size chosen so the result fits the requested count.
+
+# ?lod= presets -> maximum gaussian count
+PRESETS = {
+    "low": 200_000,
+    "medium": 500_000,
+    "high": 1_000_000,
+}
+MIN_SPLATS = 1_000
+
+# Gaussians below one 8-bit alpha level are invisible once composited
+MIN_ALPHA = 1.0 / 255.0
+# Gaussians whose largest axis is below this fraction of the scene extent
+# never cover a pixel at any sensible viewing distance
+MIN_EXTENT_FRACTION = 1e-6
+
+# Voxel size search: stop once the voxel count is within this fraction below the target
+_SEARCH_TOLERANCE = 0.02
+_SEARCH_STEPS = 24
+
+_GEOMETRY_FIELDS = {"x", "y", "z", "opacity", "scale_0", "scale_1", "scale_2", "rot_0", "rot_1", "rot_2", "rot_3"}
+
+
+def resolve_level(max_splats: Optional[int], lod: Optional[str]) -> Optional[int]:
+    """
+    Turn the request parameters into a cache level: None for the full scene,
+    otherwise a gaussian count rounded down to two significant figures, so
+    arbitrary client values share a bounded set of cached variants.
+
+    Raises:
+        ValueError: for an unknown preset or a non-positive count
+    """
+    if lod is not None:
+        if lod not in PRESETS:
+            raise ValueError(f"Invalid lod. Allowed: {', '.join(PRESETS)}")
+        level = PRESETS[lod]
+        if max_splats is not None:
+            level = min(level, max_splats)
+    elif max_splats is not None:
+        level = max_splats
+    else:
+        return None
+    if level <= 0:
+        raise ValueError("max_splats must be positive")
+    level = max(level, MIN_SPLATS)
+    magnitude = 10 ** max(0, len(str(level)) - 2)
+    return level // magnitude * magnitude
+
+
+def vertex_count(ply_path: Path) -> int:
+    return read_ply_header(ply_path).element("vertex").count
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def cull_mask(vertices: np.ndarray) -> np.ndarray:
+    """Gaussians worth keeping: visible opacity and a non-degenerate size."""
+    alpha = _sigmoid(vertices["opacity"].astype(np.float64))
+    keep = alpha >= MIN_ALPHA
+    positions = np.stack([vertices[a] for a in ("x", "y", "z")], axis=1).astype(np.float64)
+    if keep.any():
+        extent = float(np.linalg.norm(np.ptp(positions[keep], axis=0)))
+        largest = np.exp(gaussian_log_scales(vertices).max(axis=1).astype(np.float64))
+        keep &= largest >= MIN_EXTENT_FRACTION * extent
+    return keep
+
+
+def _voxel_keys(positions: np.ndarray, origin: np.ndarray, cell: float) -> np.ndarray:
+    cells = np.floor((positions - origin) / cell).astype(np.int64)
+    dims = cells.max(axis=0) + 1
+    return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+
+def _occupied_voxels(positions: np.ndarray, origin: np.ndarray, cell: float) -> int:
+    keys = np.sort(_voxel_keys(positions, origin, cell))
+    return int(np.count_nonzero(np.diff(keys))) + 1
+
+
+def _voxel_grouping(positions: np.ndarray, target: int) -> np.ndarray:
+    """
+    Voxel id per gaussian, for close to the finest grid with at most
+    `target` occupied voxels. The cell size is searched by interpolating
+    log(count) against log(cell size), bisecting every third step so the
+    search cannot stall on one side of the bracket.
+    """
+    origin = positions.min(axis=0)
+    extent = float(np.ptp(positions, axis=0).max()) or 1.0
+    # Bracket: a grid fine enough to separate every gaussian, and a single voxel
+    fine, fine_count = np.log(extent / 2 ** 21), float(len(positions))
+    coarse, coarse_count = np.log(extent * 1.001), 1.0
+    goal = np.log(target * (1 - _SEARCH_TOLERANCE / 2))
+    for step in range(_SEARCH_STEPS):
+        t = (np.log(fine_count) - goal) / (np.log(fine_count) - np.log(coarse_count))
+        cell = fine + t * (coarse - fine)
+        if step % 3 == 2 or not fine < cell < coarse:
+            cell = (fine + coarse) / 2
+        count = _occupied_voxels(positions, origin, float(np.exp(cell)))
+        if count > target:
+            fine, fine_count = cell, float(count)
+        else:
+            coarse, coarse_count = cell, float(max(count, 1))
+            if count >= target * (1 - _SEARCH_TOLERANCE):
+                break
+    _, groups = np.unique(_voxel_keys(positions, origin, float(np.exp(coarse))), return_inverse=True)
+    return groups
+
+
+def _matrix_quaternions(m: np.ndarray) -> np.ndarray:
+    """(w, x, y, z) quaternions from proper rotation matrices (Shepperd's method)."""
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    case = np.argmax(np.stack([trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]], axis=1), axis=1)
+    q = np.empty((len(m), 4))
+
+    i = case == 0
+    s = np.sqrt(np.maximum(trace[i] + 1.0, 1e-12)) * 2
+    q[i] = np.stack([s / 4, (m[i, 2, 1] - m[i, 1, 2]) / s, (m[i, 0, 2] - m[i, 2, 0]) / s,
+                     (m[i, 1, 0] - m[i, 0, 1]) / s], axis=1)
+    i = case == 1
+    s = np.sqrt(np.maximum(1.0 + m[i, 0, 0] - m[i, 1, 1] - m[i, 2, 2], 1e-12)) * 2
+    q[i] = np.stack([(m[i, 2, 1] - m[i, 1, 2]) / s, s / 4, (m[i, 0, 1] + m[i, 1, 0]) / s,
+                     (m[i, 0, 2] + m[i, 2, 0]) / s], axis=1)
+    i = case == 2
+    s = np.sqrt(np.maximum(1.0 + m[i, 1, 1] - m[i, 0, 0] - m[i, 2, 2], 1e-12)) * 2
+    q[i] = np.stack([(m[i, 0, 2] - m[i, 2, 0]) / s, (m[i, 0, 1] + m[i, 1, 0]) / s, s / 4,
+                     (m[i, 1, 2] + m[i, 2, 1]) / s], axis=1)
+    i = case == 3
+    s = np.sqrt(np.maximum(1.0 + m[i, 2, 2] - m[i, 0, 0] - m[i, 1, 1], 1e-12)) * 2
+    q[i] = np.stack([(m[i, 1, 0] - m[i, 0, 1]) / s, (m[i, 0, 2] + m[i, 2, 0]) / s,
+                     (m[i, 1, 2] + m[i, 2, 1]) / s, s / 4], axis=1)
+    return q
+
+
+def merge_groups(vertices: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    """
+    Merge the gaussians of each group into one, weighted by opacity x volume.
+    Position and covariance are moment-matched, opacity is the union
+    1 - prod(1 - alpha), and any other property is the weighted mean.
+    """
+    count = int(groups.max()) + 1
+    alpha = _sigmoid(vertices["opacity"].astype(np.float64))
+    log_scales = gaussian_log_scales(vertices).astype(np.float64)
+    weight = alpha * np.exp(log_scales.sum(axis=1) - log_scales.sum(axis=1).max()) + 1e-30
+    total = np.bincount(groups, weight, count)
+
+    def mean(values: np.ndarray) -> np.ndarray:
+        return np.bincount(groups, weight * values, count) / total
+
+    positions = np.stack([vertices[a] for a in ("x", "y", "z")], axis=1).astype(np.float64)
+    covariance = gaussian_covariances(vertices)
+
+    centre = np.stack([mean(positions[:, j]) for j in range(3)], axis=1)
+    merged_cov = np.empty((count, 3, 3))
+    for j in range(3):
+        for k in range(j, 3):
+            second_moment = mean(covariance[:, j, k] + positions[:, j] * positions[:, k])
+            merged_cov[:, j, k] = merged_cov[:, k, j] = second_moment - centre[:, j] * centre[:, k]
+    eigenvalues, eigenvectors = np.linalg.eigh(merged_cov)
+    # Proper rotation (det +1) so it converts to a quaternion
+    eigenvectors[:, :, 2] *= np.sign(np.linalg.det(eigenvectors))[:, None]
+    quaternions = _matrix_quaternions(eigenvectors)
+
+    log_transparency = np.bincount(groups, np.log1p(-np.minimum(alpha, 1 - 1e-7)), count)
+    merged_alpha = np.clip(-np.expm1(log_transparency), MIN_ALPHA, 1 - 1e-6)
+
+    out = np.empty(count, dtype=vertices.dtype)
+    for j, axis in enumerate(("x", "y", "z")):
+        out[axis] = centre[:, j]
+    for j in range(3):
+        out[f"scale_{j}"] = 0.5 * np.log(np.maximum(eigenvalues[:, j], 1e-30))
+    for j in range(4):
+        out[f"rot_{j}"] = quaternions[:, j]
+    out["opacity"] = np.log(merged_alpha / (1 - merged_alpha))
+    for name in vertices.dtype.names:
+        if name not in _GEOMETRY_FIELDS:
+            out[name] = mean(vertices[name].astype(np.float64))
+    return out
+
+
+def decimate(vertices: np.ndarray, max_splats: int) -> np.ndarray:
+    """At most `max_splats` gaussians, culled then voxel-merged, most important first."""
+    kept = np.asarray(vertices[cull_mask(vertices)])
+    if len(kept) > max_splats:
+        positions = np.stack([kept[a] for a in ("x", "y", "z")], axis=1).astype(np.float64)
+        kept = merge_groups(kept, _voxel_grouping(positions, max_splats))
+    alpha = _sigmoid(kept["opacity"].astype(np.float64))
+    importance = np.log(np.maximum(alpha, 1e-30)) + gaussian_log_scales(kept).sum(axis=1)
+    return kept[np.argsort(-importance, kind="stable")]
+
+
+def _header_bytes(header: PlyHeader, vertex_count: int) -> bytes:
+    lines = ["ply", f"format {header.format} 1.0"]
+    for element in header.elements:
+        count = vertex_count if element.name == "vertex" else element.count
+        lines.append(f"element {element.name} {count}")
+        lines.extend(f"property {ply_type} {name}" for name, ply_type in element.properties)
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+def decimate_ply(ply_path: Path, output_path: Path, max_splats: int) -> int:
+    """
+    Write a reduced copy of a gaussian PLY with at most `max_splats`
+    gaussians; elements other than the vertices are copied unchanged.
+    The output is written atomically.
+
+    Returns:
+        Number of gaussians written
+    """
+    header, vertices = load_vertices(ply_path)
+    reduced = decimate(vertices, max_splats)
+    del vertices
+
+    temp_path = output_path.with_name(f"{output_path.name}.{os.getpid()}-{threading.get_ident()}.part")
+    try:
+        with open(ply_path, "rb") as src, open(temp_path, "wb") as dst:
+            dst.write(_header_bytes(header, len(reduced)))
+            for element in header.elements:
+                if element.name == "vertex":
+                    dst.write(reduced.tobytes())
+                    continue
+                src.seek(header.element_offset(element.name))
+                dst.write(src.read(element.count * element.dtype.itemsize))
+        os.replace(temp_path, output_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return len(reduced)
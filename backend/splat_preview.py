@@ -0,0 +1,183 @@
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image, features
+from ply_utils import PlyHeader, SH_C0, gaussian_covariances, gaussian_positions, load_vertices
+
+# Small preview images of a cached scene, rendered on the CPU from the
+# source camera (ml-sharp stores its intrinsics and image size in the PLY).
+# A plain NumPy EWA splatter: each gaussian is projected to a 2D conic,
+# footprints are grouped by radius so every group rasterises as one
+# fixed-size stencil, and depth-sorted slices are alpha-composited front
+# to back. Within a slice, coverage is accumulated order-independently,
+# which is indistinguishable from exact sorting at thumbnail sizes.
+
+# Longest side of the preview, in pixels
+DEFAULT_SIZE = 256
+# Only this many of the most important gaussians are drawn (the PLY is importance-ordered)
+MAX_PREVIEW_SPLATS = 300_000
+# Gaussians closer than this to the camera plane are skipped
+NEAR_PLANE = 1e-2
+# Screen-space low-pass added to every footprint, as in the reference 3DGS rasteriser
+LOW_PASS = 0.3
+# Footprint radii (pixels) rasterised as stencils; larger footprints are clipped
+STENCIL_RADII = (1, 2, 3, 4, 6, 8, 12, 16, 24, 32)
+# Depth slices composited front to back
+DEPTH_SLICES = 24
+# Stencil pixels evaluated per preview; once the most important gaussians
+# use it up, the rest are dropped (keeps scenes of large splats bounded)
+MAX_STENCIL_PIXELS = 24_000_000
+# Upper bound on splat x stencil pixel pairs evaluated at once
+_BLOCK_PIXELS = 1 << 22
+
+WEBP_AVAILABLE = features.check("webp")
+# Preview encoding: file suffix, PIL format, media type
+PREVIEW_FORMAT = (".thumb.webp", "WEBP", "image/webp") if WEBP_AVAILABLE else (".thumb.png", "PNG", "image/png")
+
+
+def _element_values(header: PlyHeader, ply_path: Path, name: str) -> Optional[np.ndarray]:
+    try:
+        element = header.element(name)
+    except KeyError:
+        return None
+    with open(ply_path, "rb") as f:
+        f.seek(header.element_offset(name))
+        values = np.frombuffer(f.read(element.count * element.dtype.itemsize), dtype=element.dtype)
+    return values[values.dtype.names[0]].astype(np.float64)
+
+
+def _camera(header: PlyHeader, ply_path: Path, size: int) -> Tuple[int, int, np.ndarray, np.ndarray]:
+    """
+    Preview size and pinhole camera: (width, height, intrinsics 3x3,
+    world-to-camera 4x4). Falls back to a ~53 degree view from the origin
+    when the PLY carries no usable camera.
+    """
+    image_size = _element_values(header, ply_path, "image_size")
+    intrinsic = _element_values(header, ply_path, "intrinsic")
+    extrinsic = _element_values(header, ply_path, "extrinsic")
+    source_w, source_h = image_size[:2] if image_size is not None and len(image_size) >= 2 else (size, size)
+    if intrinsic is not None and len(intrinsic) == 9:
+        k = intrinsic.reshape(3, 3)
+    else:
+        focal = max(source_w, source_h)
+        k = np.array([[focal, 0, source_w / 2], [0, focal, source_h / 2], [0, 0, 1]])
+    view = np.eye(4)
+    if extrinsic is not None and len(extrinsic) == 16:
+        # Ignore placeholder (e.g. all-zero) extrinsics; only a rotation is usable
+        candidate = extrinsic.reshape(4, 4)
+        if abs(abs(np.linalg.det(candidate[:3, :3])) - 1) < 1e-3:
+            view = candidate
+
+    scale = size / max(source_w, source_h)
+    width, height = max(1, round(source_w * scale)), max(1, round(source_h * scale))
+    k = k * np.array([[scale], [scale], [1.0]])
+    return width, height, k, view
+
+
+def _stencil(radius: int) -> Tuple[np.ndarray, np.ndarray]:
+    offsets = np.arange(-radius, radius + 1, dtype=np.float32)
+    dy, dx = np.meshgrid(offsets, offsets, indexing="ij")
+    return dx.ravel(), dy.ravel()
+
+
+def render_preview(ply_path: Path, size: int = DEFAULT_SIZE, max_splats: int = MAX_PREVIEW_SPLATS) -> Image.Image:
+    """Render a gaussian PLY from its source camera to an RGBA image whose longest side is `size`."""
+    header, vertices = load_vertices(ply_path)
+    vertices = np.asarray(vertices[:max_splats])
+    width, height, k, view = _camera(header, ply_path, size)
+    pixels = width * height
+
+    rotation, translation = view[:3, :3], view[:3, 3]
+    positions = gaussian_positions(vertices).astype(np.float64) @ rotation.T + translation
+    x, y, z = positions.T
+    visible = z > NEAR_PLANE
+    vertices, x, y, z = vertices[visible], x[visible], y[visible], z[visible]
+
+    # EWA projection: 2D covariance J W Sigma W^T J^T, plus the low-pass filter
+    covariance = rotation @ gaussian_covariances(vertices) @ rotation.T
+    fx, fy, cx, cy = k[0, 0], k[1, 1], k[0, 2], k[1, 2]
+    jacobian = np.zeros((len(z), 2, 3))
+    jacobian[:, 0, 0] = fx / z
+    jacobian[:, 0, 2] = -fx * x / (z * z)
+    jacobian[:, 1, 1] = fy / z
+    jacobian[:, 1, 2] = -fy * y / (z * z)
+    screen = jacobian @ covariance @ jacobian.transpose(0, 2, 1)
+    a = screen[:, 0, 0] + LOW_PASS
+    b = screen[:, 0, 1]
+    c = screen[:, 1, 1] + LOW_PASS
+    det = np.maximum(a * c - b * b, 1e-12)
+    conic = np.stack([c / det, -b / det, a / det], axis=1)
+    largest = 0.5 * (a + c) + np.sqrt(np.maximum(0.25 * (a - c) ** 2 + b * b, 0))
+    radius = np.ceil(3 * np.sqrt(largest))
+
+    # Pixel-centre coordinates of the means
+    u = fx * x / z + cx - 0.5
+    v = fy * y / z + cy - 0.5
+    alpha = 1.0 / (1.0 + np.exp(-vertices["opacity"].astype(np.float64)))
+    onscreen = (u + radius >= 0) & (u - radius < width) & (v + radius >= 0) & (v - radius < height)
+    onscreen &= alpha >= 1.0 / 255.0
+    colors = np.clip(0.5 + SH_C0 * np.stack([vertices[f"f_dc_{i}"] for i in range(3)], axis=1), 0, 1)
+
+    # Vertices are in importance order, so the budget keeps the most important prefix
+    index = np.flatnonzero(onscreen)
+    stencil_class = np.searchsorted(STENCIL_RADII, np.minimum(radius[index], STENCIL_RADII[-1]))
+    stencil_pixels = (2 * np.asarray(STENCIL_RADII)[stencil_class] + 1) ** 2
+    within_budget = np.cumsum(stencil_pixels) <= MAX_STENCIL_PIXELS
+    index, stencil_class = index[within_budget], stencil_class[within_budget]
+    order = np.argsort(z[index], kind="stable")
+    index, stencil_class = index[order], stencil_class[order]
+    u, v, alpha, conic, colors = (values.astype(np.float32) for values in (u, v, alpha, conic, colors))
+
+    color = np.zeros((pixels, 3))
+    transmittance = np.ones(pixels)
+    for depth_slice, classes in zip(np.array_split(index, DEPTH_SLICES), np.array_split(stencil_class, DEPTH_SLICES)):
+        weighted = np.zeros((pixels, 3))
+        coverage = np.zeros(pixels)
+        log_transparency = np.zeros(pixels)
+        for class_index, stencil_radius in enumerate(STENCIL_RADII):
+            members = depth_slice[classes == class_index]
+            if not len(members):
+                continue
+            dx, dy = _stencil(stencil_radius)
+            block = max(1, _BLOCK_PIXELS // len(dx))
+            for start in range(0, len(members), block):
+                i = members[start:start + block]
+                px = np.rint(u[i])[:, None] + dx
+                py = np.rint(v[i])[:, None] + dy
+                ox, oy = px - u[i, None], py - v[i, None]
+                power = -0.5 * (conic[i, 0, None] * ox * ox + conic[i, 2, None] * oy * oy) - conic[i, 1, None] * ox * oy
+                weight = np.minimum(alpha[i, None] * np.exp(np.minimum(power, 0)), 0.99)
+                keep = (px >= 0) & (px < width) & (py >= 0) & (py < height) & (weight >= 1.0 / 255.0)
+                target = (py * width + px)[keep].astype(np.int64)
+                weight_kept = weight[keep]
+                coverage += np.bincount(target, weight_kept, pixels)
+                log_transparency += np.bincount(target, np.log1p(-weight_kept), pixels)
+                for channel in range(3):
+                    channel_values = np.broadcast_to(colors[i, channel, None], weight.shape)[keep]
+                    weighted[:, channel] += np.bincount(target, weight_kept * channel_values, pixels)
+        opacity = -np.expm1(log_transparency)
+        color += (transmittance * opacity / np.maximum(coverage, 1e-12))[:, None] * weighted
+        transmittance *= np.exp(log_transparency)
+
+    # Un-premultiply for a straight-alpha image
+    covered = 1.0 - transmittance
+    rgb = color / np.maximum(covered, 1e-6)[:, None]
+    rgba = np.concatenate([rgb, covered[:, None]], axis=1).reshape(height, width, 4)
+    return Image.fromarray(np.clip(rgba * 255.0 + 0.5, 0, 255).astype(np.uint8), "RGBA")
+
+
+def write_preview(ply_path: Path, output_path: Path, size: int = DEFAULT_SIZE) -> Path:
+    """Render the preview of a PLY and write it in `PREVIEW_FORMAT`, atomically."""
+    image = render_preview(ply_path, size)
+    temp_path = output_path.with_name(f"{output_path.name}.{os.getpid()}-{threading.get_ident()}.part")
+    try:
+        if PREVIEW_FORMAT[1] == "WEBP":
+            image.save(temp_path, format="WEBP", quality=80, method=4)
+        else:
+            image.save(temp_path, format="PNG", optimize=True)
+        os.replace(temp_path, output_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return output_path
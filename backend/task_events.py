@@ -0,0 +1,42 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+class TaskEvents:
+    """
+    In-process change notifications for task records.
+
+    The task store calls `notify` after every write; each subscriber holds
+    an asyncio.Event that is set when its task changes, and re-reads the
+    record from the store. Notifications only cover writes made by this
+    process, so subscribers should also re-read on a timeout when the
+    store is shared by several workers.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def subscribe(self, task_id: str) -> Iterator[asyncio.Event]:
+        """Register for changes to one task; the event is set on every change."""
+        item = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._subscribers.setdefault(task_id, []).append(item)
+        try:
+            yield item[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(task_id, [])
+                subscribers.remove(item)
+                if not subscribers:
+                    self._subscribers.pop(task_id, None)
+
+    def notify(self, task_ids: Iterable[str]):
+        """Wake the subscribers of these tasks (safe to call from any thread)."""
+        with self._lock:
+            targets = [item for task_id in task_ids for item in self._subscribers.get(task_id, ())]
+        for loop, event in targets:
+            loop.call_soon_threadsafe(event.set)
@@ -0,0 +1,383 @@
+import asyncio
+import math
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+from inference_pool import InferencePool
+from metrics import ADMISSION_REJECTIONS, CACHE_REQUESTS, GENERATIONS, PLY_SIZE_BYTES, STAGE_SECONDS
+from ml_sharp_service import get_service
+from ply_artifacts import ArtifactBuilder, PreviewRenderer, prepare_ply
+from ply_cache import PlyCache
+from remote_cache import RemotePlyCache
+from task_store import TaskStore
+
+# Retry-After bounds, and the batch duration assumed before one has been measured
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 300
+DEFAULT_BATCH_SECONDS = 10.0
+
+
+class GenerationRejected(Exception):
+    """
+    Raised when admission control turns a new task away: `reason` is
+    'queue_full' or 'client_limit', `retry_after` a suggested wait in seconds.
+    """
+
+    def __init__(self, reason: str, message: str, retry_after: int):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class GenerationJob:
+    """A queued PLY generation, shared by every task waiting on the same image."""
+    task_id: str
+    image_path: Path
+    output_path: Path
+    image_hash: str
+    task_ids: List[str] = field(default_factory=list)
+    # Client whose miss started the generation, counted against a per-client limit
+    clients: List[str] = field(default_factory=list)
+    # Delete the input image once the job is done (e.g. OSS temp downloads)
+    discard_input: bool = False
+    # Set once every attached task has its final status
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def __post_init__(self):
+        if not self.task_ids:
+            self.task_ids = [self.task_id]
+
+
+class GenerationQueue:
+    """
+    Background queue that runs PLY generation off the event loop.
+
+    Jobs are consumed by a fixed number of worker coroutines, each of which
+    runs the blocking generation call in a thread so request handlers,
+    status polling and file serving stay responsive during inference.
+    Jobs arriving within `batch_window` seconds of each other are grouped,
+    up to `max_batch_size`, into a single model invocation.
+    Generations are single-flight per image hash: a task submitted while
+    the same image is already queued or running attaches to that job
+    instead of launching a second inference.
+    With an `inference` pool, batches run in its worker processes instead
+    of the in-process service.
+    With a `remote` (shared OSS) tier, jobs are first looked up there and
+    only the misses are generated; new PLYs are then published to it.
+    Served variants (csplat, precompressed encodings, metadata) are built
+    by `artifacts` in the background once a job's PLY is cached, so workers
+    move on to the next batch right away.
+    With `previews`, a thumbnail of every new cache entry is rendered in
+    the background once its task has completed.
+    Admission is bounded: with `max_depth`, new generations are rejected
+    while that many are queued or running, and with `max_per_client`, a
+    client may have at most that many generations in flight (see `admit`).
+    Blocking work runs on the queue's own threads, so requests answered
+    from the cache never wait behind inference for the default executor.
+    Progress is reported by updating the records in the task store: `status`
+    (queued/running/completed/failed) plus a finer `stage`
+    (queued/inferring/sanitising/ready/failed).
+    """
+
+    def __init__(
+        self,
+        tasks: TaskStore,
+        cache: PlyCache,
+        workers: int = 1,
+        batch_window: float = 0.0,
+        max_batch_size: int = 1,
+        remote: Optional[RemotePlyCache] = None,
+        inference: Optional[InferencePool] = None,
+        previews: Optional[PreviewRenderer] = None,
+        artifacts: Optional[ArtifactBuilder] = None,
+        max_depth: int = 0,
+        max_per_client: int = 0,
+    ):
+        self.tasks = tasks
+        self.cache = cache
+        self.remote = remote
+        self.inference = inference
+        self.previews = previews
+        self.artifacts = artifacts or ArtifactBuilder(cache)
+        self.workers = max(1, workers)
+        self.batch_window = max(0.0, batch_window)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_depth = max(0, max_depth)
+        self.max_per_client = max(0, max_per_client)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        self._inflight: Dict[str, GenerationJob] = {}
+        self._client_tasks: Dict[str, int] = {}
+        # Moving average of inference batch durations, for Retry-After estimates
+        self._batch_seconds: Optional[float] = None
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="generation")
+        # Shared-tier lookups are I/O bound, and a whole batch is fetched at once
+        self._io_executor = ThreadPoolExecutor(
+            self.workers * self.max_batch_size, thread_name_prefix="generation-io"
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting to be picked up by a worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """Start the worker coroutines on the running event loop."""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Cancel the workers; jobs still queued or running are dropped and their tasks fail."""
+        for worker in self._worker_tasks:
+            worker.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+        for job in list(self._inflight.values()):
+            self._finish(job, RuntimeError("Generation queue stopped before the task finished"))
+        self._inflight.clear()
+        self._client_tasks.clear()
+
+    def admit(self, image_hash: str, client: Optional[str] = None):
+        """
+        Check that a task for this image may be submitted now. Tasks that
+        attach to an in-flight generation add no work and are always admitted.
+        A `client` of None is exempt from the per-client limit.
+
+        Raises:
+            GenerationRejected: if the queue or the client's quota is full
+        """
+        if image_hash in self._inflight:
+            return
+        if client is not None and self.max_per_client and self._client_tasks.get(client, 0) >= self.max_per_client:
+            ADMISSION_REJECTIONS.inc(reason="client_limit")
+            raise GenerationRejected(
+                "client_limit",
+                f"Too many generations in progress for this client (maximum {self.max_per_client})",
+                self._retry_after(1),
+            )
+        if self.max_depth and len(self._inflight) >= self.max_depth:
+            ADMISSION_REJECTIONS.inc(reason="queue_full")
+            raise GenerationRejected(
+                "queue_full", "Generation queue is full", self._retry_after(self.depth),
+            )
+
+    def submit(self, job: GenerationJob, client: Optional[str] = None) -> GenerationJob:
+        """
+        Enqueue a job and mark its task as queued.
+        If the same image hash is already in flight, the task attaches to the
+        existing job (and takes on its current status) instead.
+        
+        Returns:
+            The job that will produce the task's PLY
+
+        Raises:
+            GenerationRejected: see `admit`
+        """
+        if self._queue is None:
+            raise RuntimeError("Generation queue is not running")
+        self.admit(job.image_hash, client)
+        existing = self._inflight.get(job.image_hash)
+        if existing is not None:
+            existing.task_ids.append(job.task_id)
+            lead = self.tasks.get(existing.task_id) or {}
+            self.tasks.update(
+                job.task_id,
+                status=lead.get("status", "queued"),
+                stage=lead.get("stage", "queued"),
+                queued_at=lead.get("queued_at", time.time()),
+                started_at=lead.get("started_at"),
+                deduplicated=True,
+            )
+            print(f"Image hash {job.image_hash[:12]}... already in flight, attaching task {job.task_id}")
+            return existing
+
+        # Only new generations count against the client's quota; attaching adds no work
+        if client is not None:
+            job.clients.append(client)
+            self._client_tasks[client] = self._client_tasks.get(client, 0) + 1
+        self.tasks.update(job.task_id, status="queued", stage="queued", queued_at=time.time())
+        self._inflight[job.image_hash] = job
+        self._queue.put_nowait(job)
+        return job
+
+    @property
+    def active(self) -> int:
+        """Number of distinct generations queued or running."""
+        return len(self._inflight)
+
+    def in_flight(self, image_hash: str) -> bool:
+        """Check whether a generation for this image hash is queued or running."""
+        return image_hash in self._inflight
+
+    async def wait(self, image_hash: str):
+        """Wait for the in-flight generation of this image hash, if any, to finish."""
+        job = self._inflight.get(image_hash)
+        if job is not None:
+            await job.done.wait()
+
+    def _retry_after(self, queued: int) -> int:
+        """Seconds for the workers to get through `queued` waiting jobs, clamped."""
+        rounds = math.ceil(max(1, queued) / (self.workers * self.max_batch_size))
+        seconds = rounds * (self._batch_seconds or DEFAULT_BATCH_SECONDS)
+        return int(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(seconds))))
+
+    async def _worker(self, index: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch(loop)
+            try:
+                await self._run(loop, batch)
+            except Exception as e:
+                # Fail whatever the batch left in flight, but keep the worker alive
+                print(f"Generation worker {index} failed a batch: {e}")
+                for job in batch:
+                    if self._inflight.get(job.image_hash) is job:
+                        job.output_path.with_suffix(".part").unlink(missing_ok=True)
+                        self._finish(job, e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _collect_batch(self, loop: asyncio.AbstractEventLoop) -> List[GenerationJob]:
+        """Wait for one job, then gather more until the window closes or the batch is full."""
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                # Window closed: still take whatever is already waiting
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, loop: asyncio.AbstractEventLoop, batch: List[GenerationJob]):
+        if self.remote is not None:
+            batch = await self._fetch_remote(loop, batch)
+            if not batch:
+                return
+        self.tasks.update_many(
+            [task_id for job in batch for task_id in job.task_ids],
+            status="running",
+            stage="inferring",
+            started_at=time.time(),
+            batch_size=len(batch),
+        )
+        # Generate next to the cache entries and publish them with an atomic
+        # rename, so concurrent cache lookups never see a partial PLY
+        partial_paths = [job.output_path.with_suffix(".part") for job in batch]
+        for partial_path in partial_paths:
+            partial_path.parent.mkdir(exist_ok=True)
+        try:
+            service = self.inference or await loop.run_in_executor(self._executor, get_service)
+            inference_started = time.perf_counter()
+            with STAGE_SECONDS.time(stage="inference"):
+                errors = await loop.run_in_executor(
+                    self._executor,
+                    service.generate_ply_batch,
+                    [(job.image_path, partial) for job, partial in zip(batch, partial_paths)],
+                )
+            elapsed = time.perf_counter() - inference_started
+            self._batch_seconds = elapsed if self._batch_seconds is None else 0.8 * self._batch_seconds + 0.2 * elapsed
+        except Exception as e:
+            errors = [e for _ in batch]
+
+        for job, partial_path, error in zip(batch, partial_paths, errors):
+            if error is None:
+                finalise_started = time.perf_counter()
+                try:
+                    self.tasks.update_many(job.task_ids, stage="sanitising")
+                    await loop.run_in_executor(self._executor, prepare_ply, partial_path)
+                    os.replace(partial_path, job.output_path)
+                    self.cache.add(job.image_hash)
+                    PLY_SIZE_BYTES.observe(job.output_path.stat().st_size)
+                except Exception as e:
+                    error = e
+            if error is None:
+                print(f"Generated and cached PLY for image hash {job.image_hash[:12]}...")
+                STAGE_SECONDS.observe(time.perf_counter() - finalise_started, stage="finalise")
+                self.artifacts.build_async(job.image_hash)
+                if self.remote is not None:
+                    self.remote.publish_async(job.image_hash)
+            else:
+                print(f"Generation failed for image hash {job.image_hash[:12]}...: {error}")
+                partial_path.unlink(missing_ok=True)
+            self._finish(job, error)
+            if error is None and self.previews is not None:
+                self.previews.render_async(job.image_hash)
+
+    async def _fetch_remote(
+        self, loop: asyncio.AbstractEventLoop, batch: List[GenerationJob]
+    ) -> List[GenerationJob]:
+        """
+        Look the batch up in the shared OSS tier, completing jobs another
+        node has already generated.
+
+        Returns:
+            The jobs that still need inference
+        """
+        async def fetch(job: GenerationJob) -> bool:
+            try:
+                return await loop.run_in_executor(self._io_executor, self.remote.fetch, job.image_hash)
+            except Exception as e:
+                print(f"OSS cache lookup failed for image hash {job.image_hash[:12]}...: {e}")
+                return False
+
+        found = await asyncio.gather(*(fetch(job) for job in batch))
+        remaining = []
+        for job, hit in zip(batch, found):
+            if not hit:
+                remaining.append(job)
+                continue
+            print(f"Fetched PLY for image hash {job.image_hash[:12]}... from OSS cache")
+            CACHE_REQUESTS.inc(result="remote_hit")
+            self.artifacts.build_async(job.image_hash)
+            self.tasks.update_many(job.task_ids, cached=True)
+            self._finish(job, None)
+            if self.previews is not None:
+                self.previews.render_async(job.image_hash)
+        return remaining
+
+    def _finish(self, job: GenerationJob, error: Optional[Exception]):
+        # The cache file is in place before the hash leaves the registry,
+        # so a new request sees either the in-flight job or the cached PLY
+        del self._inflight[job.image_hash]
+        for client in job.clients:
+            remaining = self._client_tasks.get(client, 0) - 1
+            if remaining > 0:
+                self._client_tasks[client] = remaining
+            else:
+                self._client_tasks.pop(client, None)
+        if job.discard_input:
+            job.image_path.unlink(missing_ok=True)
+
+        GENERATIONS.inc(result="completed" if error is None else "failed")
+        try:
+            if error is None:
+                self.tasks.update_many(
+                    job.task_ids, status="completed", stage="ready", finished_at=time.time()
+                )
+            else:
+                self.tasks.update_many(
+                    job.task_ids, status="failed", stage="failed", error=str(error), finished_at=time.time()
+                )
+        except Exception as e:
+            # Waiters are released regardless; their tasks read back as they were
+            print(f"Failed to record the result for image hash {job.image_hash[:12]}...: {e}")
+        finally:
+            job.done.set()
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Tuple
+import config
+
+
+class TaskStore(ABC):
+    """
+    Storage for task status records (plain JSON-serialisable dicts).
+
+    Records expire `ttl_seconds` after their last update. Fields set to
+    None are dropped, so records only hold what is known about a task.
+    Listeners are called with the affected task ids after every write.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._listeners: List[Callable[[List[str]], None]] = []
+
+    def add_listener(self, listener: Callable[[List[str]], None]):
+        self._listeners.append(listener)
+
+    def _notify(self, task_ids: List[str]):
+        for listener in self._listeners:
+            listener(task_ids)
+
+    @abstractmethod
+    def create(self, task_id: str, record: dict):
+        """Insert (or replace) a task record."""
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[dict]:
+        """Return a live task record, or None if unknown or expired."""
+
+    def update(self, task_id: str, **fields):
+        """Merge fields into an existing record (no-op for unknown tasks)."""
+        self.update_many([task_id], **fields)
+
+    @abstractmethod
+    def update_many(self, task_ids: Iterable[str], **fields):
+        """Merge the same fields into several records at once."""
+
+    @abstractmethod
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Tuple[str, dict]]:
+        """Most recently updated live tasks, optionally only those with `status`."""
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Delete expired records, returning how many were removed."""
+
+    async def run_sweeper(self, interval: float):
+        """Sweep periodically in a worker thread until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                removed = await loop.run_in_executor(None, self.sweep)
+                if removed:
+                    print(f"Task store sweep: {removed} expired")
+            except Exception as e:
+                print(f"Task store sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+
+def _compact(fields: dict) -> dict:
+    return {k: v for k, v in fields.items() if v is not None}
+
+
+class MemoryTaskStore(TaskStore):
+    """
+    In-process store bounded to `max_tasks` records; the least recently
+    updated record is dropped when it is full. Only suitable for a single
+    worker process.
+    """
+
+    def __init__(self, ttl_seconds: float, max_tasks: int = 100_000):
+        super().__init__(ttl_seconds)
+        self.max_tasks = max(1, max_tasks)
+        self._records: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, task_id: str, record: dict):
+        with self._lock:
+            self._records[task_id] = (time.time(), _compact(record))
+            self._records.move_to_end(task_id)
+            while len(self._records) > self.max_tasks:
+                self._records.popitem(last=False)
+        self._notify([task_id])
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            item = self._records.get(task_id)
+            if item is None:
+                return None
+            updated, record = item
+            if time.time() - updated >= self.ttl_seconds:
+                del self._records[task_id]
+                return None
+            return dict(record)
+
+    def update_many(self, task_ids: Iterable[str], **fields):
+        task_ids = list(task_ids)
+        now = time.time()
+        with self._lock:
+            for task_id in task_ids:
+                item = self._records.get(task_id)
+                if item is None:
+                    continue
+                record = item[1]
+                record.update(fields)
+                self._records[task_id] = (now, _compact(record))
+                self._records.move_to_end(task_id)
+        self._notify(task_ids)
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Tuple[str, dict]]:
+        cutoff = time.time() - self.ttl_seconds
+        result = []
+        with self._lock:
+            for task_id, (updated, record) in reversed(self._records.items()):
+                if len(result) >= limit or updated < cutoff:
+                    break
+                if status is None or record.get("status") == status:
+                    result.append((task_id, dict(record)))
+        return result
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        with self._lock:
+            # Ordered by last update, so expired records are at the front
+            while self._records:
+                task_id, (updated, _) = next(iter(self._records.items()))
+                if updated >= cutoff:
+                    break
+                del self._records[task_id]
+                removed += 1
+        return removed
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Store backed by a SQLite database in WAL mode, shared by every worker
+    process on the host, so any process can answer /api/status and records
+    survive restarts. Status is a column of its own for indexed listing;
+    the rest of the record is stored as compact JSON.
+    """
+
+    def __init__(self, db_path: Path, ttl_seconds: float, busy_timeout: float = 1.0):
+        super().__init__(ttl_seconds)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Writes run on the event loop, so a locked database must fail fast rather than stall it
+        self._db = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None, timeout=busy_timeout
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " updated REAL NOT NULL,"
+            " data TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_updated ON tasks(updated)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, updated)")
+
+    def create(self, task_id: str, record: dict):
+        record = _compact(record)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO tasks (id, status, updated, data) VALUES (?, ?, ?, ?)",
+                (task_id, record.get("status", ""), time.time(), self._dumps(record)),
+            )
+        self._notify([task_id])
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM tasks WHERE id = ? AND updated >= ?",
+                (task_id, time.time() - self.ttl_seconds),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_many(self, task_ids: Iterable[str], **fields):
+        task_ids = list(task_ids)
+        now = time.time()
+        with self._lock:
+            # Read-modify-write in one write transaction, so concurrent
+            # updates from other processes are never lost
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for task_id in task_ids:
+                    row = self._db.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+                    if row is None:
+                        continue
+                    record = json.loads(row[0])
+                    record.update(fields)
+                    record = _compact(record)
+                    self._db.execute(
+                        "UPDATE tasks SET status = ?, updated = ?, data = ? WHERE id = ?",
+                        (record.get("status", ""), now, self._dumps(record), task_id),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        self._notify(task_ids)
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Tuple[str, dict]]:
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            if status is None:
+                rows = self._db.execute(
+                    "SELECT id, data FROM tasks WHERE updated >= ? ORDER BY updated DESC LIMIT ?",
+                    (cutoff, limit),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT id, data FROM tasks WHERE status = ? AND updated >= ?"
+                    " ORDER BY updated DESC LIMIT ?",
+                    (status, cutoff, limit),
+                ).fetchall()
+        return [(task_id, json.loads(data)) for task_id, data in rows]
+
+    def sweep(self) -> int:
+        with self._lock:
+            cursor = self._db.execute(
+                "DELETE FROM tasks WHERE updated < ?", (time.time() - self.ttl_seconds,)
+            )
+        return cursor.rowcount
+
+    @staticmethod
+    def _dumps(record: dict) -> str:
+        return json.dumps(record, separators=(",", ":"))
+
+
+def create_task_store() -> TaskStore:
+    """
+    Create the task store selected by `config.TASK_STORE`:
+    - "memory": bounded in-process store (default, single worker)
+    - "sqlite": WAL database at `config.TASK_STORE_PATH`, shared by worker processes
+    """
+    backend = getattr(config, "TASK_STORE", "memory")
+    ttl_seconds = getattr(config, "TASK_TTL_SECONDS", 86400)
+    if backend == "sqlite":
+        db_path = Path(getattr(config, "TASK_STORE_PATH", config.CACHE_DIR / "tasks.sqlite3"))
+        return SQLiteTaskStore(db_path, ttl_seconds, getattr(config, "TASK_STORE_BUSY_TIMEOUT", 1.0))
+    if backend == "memory":
+        return MemoryTaskStore(ttl_seconds, getattr(config, "TASK_STORE_MAX_TASKS", 100_000))
+    raise ValueError(f"Unknown TASK_STORE: {backend}")
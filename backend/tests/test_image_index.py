@@ -0,0 +1,16 @@
+from image_index import ImageKeyIndex
+from image_normalize import NormalizedImage
+
+
+def test_prune_forgets_uncached_keys(tmp_path):
+    index = ImageKeyIndex(tmp_path / "index.sqlite3")
+    other = ImageKeyIndex(tmp_path / "index.sqlite3")
+    index.put("f1", NormalizedImage("a" * 64, 0b1111, 64, 48))
+    index.put("f2", NormalizedImage("b" * 64, 0b1110, 64, 48))
+    assert other.nearest(0b1111, 1) == ["a" * 64, "b" * 64]
+
+    assert index.prune(lambda key: key == "b" * 64, min_age=0) == 1
+    assert index.get("f1") is None
+    assert index.get("f2") is not None
+    # Other processes rebuild their in-memory hashes after a prune
+    assert other.nearest(0b1111, 1) == ["b" * 64]
@@ -0,0 +1,21 @@
+from ply_cache import PlyCache
+
+
+def _entry(cache: PlyCache, image_hash: str):
+    cache.path_for(image_hash).parent.mkdir(exist_ok=True)
+    for suffix in (".ply", ".csplat"):
+        cache.path_for(image_hash, suffix).write_bytes(b"x" * 100)
+    cache.add(image_hash)
+
+
+def test_sweep_evicts_least_recently_used_files(tmp_path):
+    cache = PlyCache(tmp_path, ttl_seconds=3600, max_bytes=300)
+    for image_hash in ("a" * 64, "b" * 64):
+        _entry(cache, image_hash)
+    cache.lookup("b" * 64)
+
+    assert cache.sweep() == (0, 1)
+    assert not cache.path_for("a" * 64).exists()
+    assert not cache.path_for("a" * 64, ".csplat").exists()
+    assert cache.lookup("a" * 64) is None
+    assert cache.lookup("b" * 64) is not None
@@ -0,0 +1,98 @@
+import asyncio
+import sqlite3
+from pathlib import Path
+import pytest
+from ply_cache import PlyCache
+from task_queue import GenerationJob, GenerationQueue, GenerationRejected
+from task_store import MemoryTaskStore
+
+
+def _job(tmp_path: Path, task_id: str, image_hash: str) -> GenerationJob:
+    return GenerationJob(task_id, tmp_path / f"{task_id}.png", tmp_path / f"{image_hash}.ply", image_hash)
+
+
+def _run_admission(tmp_path: Path, scenario, **limits):
+    async def run():
+        queue = GenerationQueue(MemoryTaskStore(3600), PlyCache(tmp_path, ttl_seconds=3600), **limits)
+        # Workers are cancelled before they first run, so nothing is generated
+        await queue.start()
+        try:
+            scenario(queue)
+        finally:
+            await queue.stop()
+    asyncio.run(run())
+
+
+def test_attach_is_admitted_at_client_limit(tmp_path):
+    def scenario(queue):
+        lead = queue.submit(_job(tmp_path, "t1", "a" * 64), client="10.0.0.1")
+        assert queue.submit(_job(tmp_path, "t2", "a" * 64), client="10.0.0.1") is lead
+        with pytest.raises(GenerationRejected) as rejected:
+            queue.submit(_job(tmp_path, "t3", "b" * 64), client="10.0.0.1")
+        assert rejected.value.reason == "client_limit"
+        assert rejected.value.retry_after >= 1
+
+    _run_admission(tmp_path, scenario, max_per_client=1)
+
+
+def test_attach_is_admitted_when_queue_is_full(tmp_path):
+    def scenario(queue):
+        queue.submit(_job(tmp_path, "t1", "a" * 64), client="10.0.0.1")
+        queue.admit("a" * 64, client="10.0.0.2")
+        with pytest.raises(GenerationRejected) as rejected:
+            queue.admit("b" * 64, client="10.0.0.2")
+        assert rejected.value.reason == "queue_full"
+
+    _run_admission(tmp_path, scenario, max_depth=1)
+
+
+def test_attach_does_not_count_against_client_limit(tmp_path):
+    def scenario(queue):
+        queue.submit(_job(tmp_path, "t1", "a" * 64), client="10.0.0.1")
+        queue.submit(_job(tmp_path, "t2", "a" * 64), client="10.0.0.2")
+        queue.admit("b" * 64, client="10.0.0.2")
+
+    _run_admission(tmp_path, scenario, max_per_client=1)
+
+
+class _StubInference:
+    """Stands in for the inference pool; every image "succeeds" instantly."""
+
+    def generate_ply_batch(self, jobs):
+        for _, output_path in jobs:
+            output_path.write_bytes(b"ply")
+        return [None for _ in jobs]
+
+
+class _LockedCache(PlyCache):
+    def add(self, image_hash):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_finalise_error_fails_the_task_and_keeps_the_worker(tmp_path):
+    async def run():
+        tasks = MemoryTaskStore(3600)
+        queue = GenerationQueue(tasks, _LockedCache(tmp_path, ttl_seconds=3600), inference=_StubInference())
+        await queue.start()
+        try:
+            for task_id, image_hash in (("t1", "a" * 64), ("t2", "b" * 64)):
+                tasks.create(task_id, {"status": "queued"})
+                job = queue.submit(_job(tmp_path, task_id, image_hash))
+                await asyncio.wait_for(job.done.wait(), 5)
+                assert tasks.get(task_id)["status"] == "failed"
+        finally:
+            await queue.stop()
+    asyncio.run(run())
+
+
+def test_stop_fails_dropped_tasks(tmp_path):
+    async def run():
+        tasks = MemoryTaskStore(3600)
+        queue = GenerationQueue(tasks, PlyCache(tmp_path, ttl_seconds=3600))
+        await queue.start()
+        tasks.create("t1", {"status": "queued"})
+        job = queue.submit(_job(tmp_path, "t1", "a" * 64))
+        await queue.stop()
+        assert job.done.is_set()
+        assert tasks.get("t1")["status"] == "failed"
+    asyncio.run(run())
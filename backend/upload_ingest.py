@@ -0,0 +1,51 @@
+import hashlib
+from dataclasses import dataclass
+from pathlib import Path
+import aiofiles
+from fastapi import UploadFile
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+
+@dataclass
+class IngestedUpload:
+    """An upload written to disk, with the facts gathered while streaming it."""
+    path: Path
+    sha256: str
+    size: int
+
+
+async def ingest_upload(
+    upload: UploadFile,
+    dest: Path,
+    max_bytes: int = 0,
+    chunk_size: int = 1024 * 1024,
+) -> IngestedUpload:
+    """
+    Stream an upload to `dest` in a single pass.
+    Hashes the content and enforces `max_bytes` (0 disables the limit) while
+    the chunks are written, so the file never has to be re-read.
+
+    Raises:
+        UploadTooLarge: if the upload exceeds `max_bytes` (the partial file is removed)
+    """
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(dest, "wb") as out:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+                sha.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        dest.unlink(missing_ok=True)
+        raise
+
+    return IngestedUpload(dest, sha.hexdigest(), size)
@@ -5,6 +5,7 @@ const API_BASE_URL = '/api'
 export const api = {
     /**
      * Upload image and generate PLY file
+     * Status is 'completed' on a cache hit, otherwise 'queued' (see waitForTask)
      * @param {File} file - Image file to upload
      * @returns {Promise<{task_id: string, ply_filename: string, status: string}>}
      */
@@ -34,10 +35,36 @@ export const api = {
     /**
      * Get PLY file URL
      * @param {string} filename - PLY filename
+     * @param {string} [format] - 'ply' (default) or 'csplat' for the compact splat encoding
+     * @param {string} [lod] - 'low', 'medium' or 'high' for a reduced gaussian count (default: full scene)
      * @returns {string} URL to PLY file
      */
-    getPlyUrl(filename) {
-        return `${API_BASE_URL}/ply/${filename}`
+    getPlyUrl(filename, format = 'ply', lod = null) {
+        const params = new URLSearchParams()
+        if (format !== 'ply') params.set('format', format)
+        if (lod) params.set('lod', lod)
+        const query = params.toString()
+        return `${API_BASE_URL}/ply/${filename}${query ? `?${query}` : ''}`
+    },
+
+    /**
+     * Get the metadata sidecar of a generated PLY (vertex count, bounds,
+     * centroid, scale/opacity percentiles) without downloading the splats
+     * @param {string} filename - PLY filename
+     * @returns {Promise<{vertex_count: number, bounds?: object, robust_bounds?: object, centroid?: number[]}>}
+     */
+    async getPlyMeta(filename) {
+        const response = await axios.get(`${API_BASE_URL}/ply/${filename}/meta`)
+        return response.data
+    },
+
+    /**
+     * Get the URL of the server-rendered preview image of a generated PLY
+     * @param {string} filename - PLY filename
+     * @returns {string} URL to the thumbnail (WebP or PNG)
+     */
+    getThumbnailUrl(filename) {
+        return `${API_BASE_URL}/thumbnail/${filename.replace(/\.ply$/, '')}`
     },
 
     /**
@@ -48,5 +75,50 @@ export const api = {
     async getTaskStatus(taskId) {
         const response = await axios.get(`${API_BASE_URL}/status/${taskId}`)
         return response.data
+    },
+
+    /**
+     * Follow task progress pushed by the server (Server-Sent Events) until
+     * generation completes or fails; falls back to polling if the stream fails
+     * @param {string} taskId - Task ID
+     * @param {(task: object) => void} [onProgress] - Called with each task update (see `stage`)
+     * @returns {Promise<{status: string, stage: string, ply_filename?: string, error?: string}>}
+     */
+    watchTask(taskId, onProgress = () => {}) {
+        if (typeof EventSource === 'undefined') return this.waitForTask(taskId)
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`${API_BASE_URL}/status/${taskId}/events`)
+            source.onmessage = (event) => {
+                const task = JSON.parse(event.data)
+                onProgress(task)
+                if (task.status === 'completed') {
+                    source.close()
+                    resolve(task)
+                } else if (task.status === 'failed') {
+                    source.close()
+                    reject(new Error(task.error || 'Generation failed'))
+                }
+            }
+            source.onerror = () => {
+                // Stream unavailable (e.g. a proxy without SSE support): poll instead
+                source.close()
+                this.waitForTask(taskId).then(resolve, reject)
+            }
+        })
+    },
+
+    /**
+     * Poll task status until generation completes or fails
+     * @param {string} taskId - Task ID
+     * @param {number} interval - Poll interval in milliseconds
+     * @returns {Promise<{status: string, ply_filename?: string, error?: string}>}
+     */
+    async waitForTask(taskId, interval = 1000) {
+        while (true) {
+            const task = await this.getTaskStatus(taskId)
+            if (task.status === 'completed') return task
+            if (task.status === 'failed') throw new Error(task.error || 'Generation failed')
+            await new Promise(resolve => setTimeout(resolve, interval))
+        }
     }
 }
@@ -0,0 +1,82 @@
+// Decoder for the backend's compact splat encoding (backend/splat_codec.py).
+// Expands 16-byte quantised records into gsplat's 32-byte .splat layout:
+// position float32[3], scale float32[3], RGBA uint8[4], rotation uint8[4].
+
+const MAGIC = 'CSPL'
+export const CSPLAT_HEADER_SIZE = 48
+export const CSPLAT_RECORD_SIZE = 16
+export const SPLAT_RECORD_SIZE = 32
+
+/**
+ * Parse the compact splat header
+ * @param {ArrayBuffer} buffer - Buffer holding at least the header
+ * @returns {{count: number, posMin: number[], posMax: number[], scaleMin: number, scaleMax: number}}
+ */
+export function parseCsplatHeader(buffer) {
+    const view = new DataView(buffer, 0, CSPLAT_HEADER_SIZE)
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4))
+    if (magic !== MAGIC) throw new Error('Not a compact splat file')
+    const version = view.getUint32(4, true)
+    if (version !== 1) throw new Error(`Unsupported compact splat version ${version}`)
+    const f = (offset) => view.getFloat32(offset, true)
+    return {
+        count: view.getUint32(8, true),
+        posMin: [f(12), f(16), f(20)],
+        posMax: [f(24), f(28), f(32)],
+        scaleMin: f(36),
+        scaleMax: f(40)
+    }
+}
+
+/**
+ * Decode compact splat records into a .splat buffer for SPLAT.Loader
+ * @param {object} header - Result of parseCsplatHeader
+ * @param {Uint8Array} records - Whole records (length multiple of CSPLAT_RECORD_SIZE)
+ * @returns {ArrayBuffer}
+ */
+export function decodeCsplatRecords(header, records) {
+    const count = Math.floor(records.byteLength / CSPLAT_RECORD_SIZE)
+    const out = new ArrayBuffer(count * SPLAT_RECORD_SIZE)
+    const outF32 = new Float32Array(out)
+    const outU8 = new Uint8Array(out)
+    const view = new DataView(records.buffer, records.byteOffset, records.byteLength)
+
+    const posScale = header.posMax.map((max, i) => (max - header.posMin[i]) / 65535)
+    const scaleStep = (header.scaleMax - header.scaleMin) / 255
+
+    for (let i = 0; i < count; i++) {
+        const src = i * CSPLAT_RECORD_SIZE
+        const dstF = i * 8
+        const dstB = i * SPLAT_RECORD_SIZE
+
+        for (let a = 0; a < 3; a++) {
+            outF32[dstF + a] = header.posMin[a] + view.getUint16(src + a * 2, true) * posScale[a]
+            outF32[dstF + 3 + a] = Math.exp(header.scaleMin + records[src + 6 + a] * scaleStep)
+        }
+        for (let c = 0; c < 4; c++) {
+            outU8[dstB + 24 + c] = records[src + 9 + c]
+        }
+
+        // Rotation: stored x, y, z of a unit quaternion with w >= 0
+        const x = records[src + 13] / 127.5 - 1
+        const y = records[src + 14] / 127.5 - 1
+        const z = records[src + 15] / 127.5 - 1
+        const w = Math.sqrt(Math.max(0, 1 - x * x - y * y - z * z))
+        const q = [w, x, y, z]
+        for (let c = 0; c < 4; c++) {
+            outU8[dstB + 28 + c] = Math.min(255, Math.max(0, Math.round(q[c] * 128 + 128)))
+        }
+    }
+    return out
+}
+
+/**
+ * Decode a complete compact splat file into a .splat buffer
+ * @param {ArrayBuffer} buffer - Compact splat file
+ * @returns {ArrayBuffer}
+ */
+export function decodeCsplat(buffer) {
+    const header = parseCsplatHeader(buffer)
+    const records = new Uint8Array(buffer, CSPLAT_HEADER_SIZE, header.count * CSPLAT_RECORD_SIZE)
+    return decodeCsplatRecords(header, records)
+}